@@ -21,6 +21,12 @@ class Settings:
     MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minioadmin")
     MINIO_SECURE = os.getenv("MINIO_SECURE", "false").lower() == "true"
     MINIO_BUCKET = os.getenv("MINIO_BUCKET", "photo-restoration")
+    # Connection pool of the shared MinIO client; keep it above STORAGE_UPLOAD_THREADS
+    # plus concurrent image reads, and open MINIO_PREWARM_CONNECTIONS at startup
+    MINIO_POOL_MAXSIZE = int(os.getenv("MINIO_POOL_MAXSIZE", "32"))
+    MINIO_CONNECT_TIMEOUT_SECONDS = float(os.getenv("MINIO_CONNECT_TIMEOUT_SECONDS", "10"))
+    MINIO_READ_TIMEOUT_SECONDS = float(os.getenv("MINIO_READ_TIMEOUT_SECONDS", "300"))
+    MINIO_PREWARM_CONNECTIONS = int(os.getenv("MINIO_PREWARM_CONNECTIONS", "4"))
     
     # Google AI
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -32,6 +38,92 @@ class Settings:
     EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
     EMAIL_FROM = os.getenv("EMAIL_FROM")
     
+    # Background enhancement jobs
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+    JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+    
+    # Enhancement result cache
+    RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000"))
+    RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+    
+    # Process pool for CPU-bound image work (0 runs it on threads instead)
+    IMAGE_POOL_WORKERS = int(os.getenv("IMAGE_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+    IMAGE_POOL_MAX_QUEUE = int(os.getenv("IMAGE_POOL_MAX_QUEUE", "32"))
+    
+    # Image model backend: "gemini", or "fake" for offline load tests (see fake_enhancer.py)
+    ENHANCER_BACKEND = os.getenv("ENHANCER_BACKEND", "gemini")
+    
+    # Gemini upstream quota (an RPM/TPM limit of 0 disables it)
+    GEMINI_RPM_LIMIT = int(os.getenv("GEMINI_RPM_LIMIT", "0"))
+    GEMINI_TPM_LIMIT = int(os.getenv("GEMINI_TPM_LIMIT", "0"))
+    GEMINI_MIN_CONCURRENCY = int(os.getenv("GEMINI_MIN_CONCURRENCY", "1"))
+    GEMINI_INITIAL_CONCURRENCY = int(os.getenv("GEMINI_INITIAL_CONCURRENCY", "4"))
+    GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))
+    GEMINI_LATENCY_TARGET_SECONDS = float(os.getenv("GEMINI_LATENCY_TARGET_SECONDS", "45"))
+    GEMINI_QUEUE_SIZE = int(os.getenv("GEMINI_QUEUE_SIZE", "64"))
+    GEMINI_QUEUE_TIMEOUT_SECONDS = float(os.getenv("GEMINI_QUEUE_TIMEOUT_SECONDS", "120"))
+    
+    # Gemini retries, hedging and circuit breaker
+    GEMINI_CALL_TIMEOUT_SECONDS = float(os.getenv("GEMINI_CALL_TIMEOUT_SECONDS", "90"))
+    GEMINI_RETRY_ATTEMPTS = int(os.getenv("GEMINI_RETRY_ATTEMPTS", "3"))
+    GEMINI_RETRY_BASE_DELAY_SECONDS = float(os.getenv("GEMINI_RETRY_BASE_DELAY_SECONDS", "1"))
+    GEMINI_RETRY_MAX_DELAY_SECONDS = float(os.getenv("GEMINI_RETRY_MAX_DELAY_SECONDS", "20"))
+    GEMINI_HEDGE_ENABLED = os.getenv("GEMINI_HEDGE_ENABLED", "false").lower() == "true"
+    GEMINI_HEDGE_BUDGET = float(os.getenv("GEMINI_HEDGE_BUDGET", "0.05"))
+    GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+    GEMINI_BREAKER_COOLDOWN_SECONDS = float(os.getenv("GEMINI_BREAKER_COOLDOWN_SECONDS", "30"))
+    
+    # Upload ingest: size and pixel limits, and the size above which uploads are spooled to disk
+    UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+    UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", "100000000"))
+    UPLOAD_SPOOL_THRESHOLD_BYTES = int(os.getenv("UPLOAD_SPOOL_THRESHOLD_BYTES", str(4 * 1024 * 1024)))
+    UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+    
+    # Local processing tier (NumPy tone pipeline, see local_enhancer.py): modes always served
+    # locally instead of by the model, e.g. "enlighten", and whether users without credits
+    # get the locally supported modes for free instead of a 403
+    LOCAL_TIER_MODES = [mode.strip() for mode in os.getenv("LOCAL_TIER_MODES", "").split(",") if mode.strip()]
+    LOCAL_TIER_FREE_FALLBACK = os.getenv("LOCAL_TIER_FREE_FALLBACK", "false").lower() == "true"
+    
+    # Tiled enhancement: sources larger than one model call in these resolutions are
+    # enhanced as overlapping tiles, up to TILED_MAX_SIZE px on the longest side
+    TILED_ENABLED = os.getenv("TILED_ENABLED", "false").lower() == "true"
+    TILED_RESOLUTIONS = [r.strip() for r in os.getenv("TILED_RESOLUTIONS", "hd").split(",") if r.strip()]
+    TILED_MAX_SIZE = int(os.getenv("TILED_MAX_SIZE", "4096"))
+    TILED_OVERLAP = int(os.getenv("TILED_OVERLAP", "192"))
+    TILED_MAX_PARALLEL = int(os.getenv("TILED_MAX_PARALLEL", "4"))
+    
+    # Idempotency-Key handling on the image endpoints: how long a stored response
+    # is replayed, and after how long an unfinished request's key is taken over
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "900"))
+    
+    # Upload verification: compare the ETag MinIO returns with the MD5 of the uploaded bytes,
+    # and read back this share of uploads (0-1) for a full SHA-256 comparison, for debugging
+    STORAGE_VERIFY_ETAG = os.getenv("STORAGE_VERIFY_ETAG", "true").lower() == "true"
+    STORAGE_DEEP_VERIFY_RATE = float(os.getenv("STORAGE_DEEP_VERIFY_RATE", "0"))
+    # Threads shared by all requests for uploading result objects concurrently
+    STORAGE_UPLOAD_THREADS = int(os.getenv("STORAGE_UPLOAD_THREADS", "8"))
+    
+    # Presigned image URLs: lifetime, and share of it (0-1) during which the same URL is handed out again
+    PRESIGNED_URL_EXPIRES_SECONDS = int(os.getenv("PRESIGNED_URL_EXPIRES_SECONDS", "3600"))
+    PRESIGNED_URL_CACHE_ENABLED = os.getenv("PRESIGNED_URL_CACHE_ENABLED", "true").lower() == "true"
+    PRESIGNED_URL_CACHE_MAX_ENTRIES = int(os.getenv("PRESIGNED_URL_CACHE_MAX_ENTRIES", "10000"))
+    PRESIGNED_URL_REUSE_FRACTION = float(os.getenv("PRESIGNED_URL_REUSE_FRACTION", "0.75"))
+    
+    # GET /api/image: chunk size streamed from MinIO, and client cache lifetime of uuid-named (write-once) objects
+    IMAGE_STREAM_CHUNK_BYTES = int(os.getenv("IMAGE_STREAM_CHUNK_BYTES", "65536"))
+    IMAGE_CACHE_MAX_AGE_SECONDS = int(os.getenv("IMAGE_CACHE_MAX_AGE_SECONDS", "31536000"))
+    
+    # Batch enhancement
+    BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "20"))
+    BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+    
+    # GET /api/metrics: token expected in the X-Metrics-Token header (unset disables the endpoint)
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    
     # App Settings
     APP_NAME = "Photo Restoration API"
     APP_VERSION = "1.0.0"
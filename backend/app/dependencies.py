@@ -0,0 +1,40 @@
+"""
+FastAPI dependencies for the long-lived services created in main.lifespan.
+
+One StorageService (one Minio client and connection pool), one
+EnhancementService (one model client) and one EmailService (one SES
+client) serve every request, so keep-alive connections and TLS sessions
+are reused instead of being rebuilt per request.
+"""
+import hmac
+from typing import Optional
+from fastapi import Header, HTTPException, Request
+from .config.settings import settings
+from .services import EnhancementService, JobService, StorageService
+
+
+def get_storage_service(request: Request) -> StorageService:
+    return request.app.state.storage_service
+
+
+def get_enhancement_service(request: Request) -> EnhancementService:
+    return request.app.state.enhancement_service
+
+
+def get_job_service(request: Request) -> JobService:
+    return request.app.state.job_service
+
+
+def get_email_service(request: Request):
+    """The shared EmailService; 503 when it could not be initialized (e.g. boto3 missing)"""
+    email_service = getattr(request.app.state, "email_service", None)
+    if email_service is None:
+        raise HTTPException(status_code=503, detail="Email service not available")
+    return email_service
+
+
+def require_metrics_token(x_metrics_token: Optional[str] = Header(None, alias="X-Metrics-Token")):
+    """Guard for internal endpoints; 404 unless METRICS_TOKEN is set and sent in X-Metrics-Token"""
+    if not settings.METRICS_TOKEN or not x_metrics_token \
+            or not hmac.compare_digest(x_metrics_token.encode(), settings.METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=404, detail="Not Found")
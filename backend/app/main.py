@@ -2,13 +2,14 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
+import asyncio
 import os
 import sys
 import logging
 from starlette.middleware.trustedhost import TrustedHostMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
-from starlette.responses import Response
+from starlette.responses import JSONResponse, Response
 
 # Import from backend root directory
 sys.path.append('/app')
@@ -21,8 +22,9 @@ except ImportError:
 
 from .models import engine
 from .config import settings
-from .routes import enhancement_router, purchase_router, analytics_router, user_router, email_router, menu_configuration_router, filters_router, custom_edits_router, debug_router
-from .services import StorageService, EnhancementService
+from .routes import enhancement_router, purchase_router, analytics_router, user_router, email_router, menu_configuration_router, filters_router, custom_edits_router, debug_router, jobs_router, metrics_router
+from .services import StorageService, EnhancementService, JobService
+from .services.image_process_pool import image_pool
 from .admin import setup_admin
 from .utils import seed_menu_data_if_needed
 
@@ -50,12 +52,93 @@ class HTTPSRedirectMiddleware(BaseHTTPMiddleware):
         response = await call_next(request)
         return response
 
+class UploadSizeLimitMiddleware:
+    """
+    Refuses request bodies above the upload limit with 413 before a route
+    runs. Form parsing reads and spools the whole multipart body before the
+    handler (and so UploadIngest) sees the upload, so the limit has to be
+    enforced here: by Content-Length up front, or by counting the body as it
+    streams in when no length is declared.
+    """
+
+    # Multipart boundaries, part headers and the other form fields
+    FORM_OVERHEAD_BYTES = 1024 * 1024
+
+    def __init__(self, app, max_bytes: int, batch_files: int):
+        self.app = app
+        self.max_bytes = max_bytes + self.FORM_OVERHEAD_BYTES
+        self.batch_max_bytes = max_bytes * batch_files + self.FORM_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.batch_max_bytes if scope["path"].rstrip("/").endswith("/enhance/batch") else self.max_bytes
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            await self._reject(scope, send, int(content_length), limit)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Stop reading; the parser sees a disconnect and the app's error response is replaced below
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded and not response_started:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded or response_started:
+                raise
+        if exceeded and not response_started:
+            await self._reject(scope, send, received, limit)
+
+    async def _reject(self, scope, send, size: int, limit: int):
+        from .services.upload_ingest import upload_ingest
+        upload_ingest.rejected_size += 1
+        logger.warning(f"Rejected {scope['method']} {scope['path']}: body of {size} bytes exceeds {limit}")
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"File is too large: the maximum upload size is {settings.UPLOAD_MAX_BYTES / (1024 * 1024):.0f}MB"},
+            headers={"Connection": "close"}
+        )
+        await response(scope, self._no_receive, send)
+
+    @staticmethod
+    async def _no_receive():
+        return {"type": "http.disconnect"}
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting up application...")
     
+    # Fork image workers first, while the process has no other threads
+    image_pool.start()
+    
+    # One instance of each service serves every request (see app.dependencies)
     storage_service = StorageService()
     storage_service.initialize()
+    await asyncio.to_thread(storage_service.prewarm, settings.MINIO_PREWARM_CONNECTIONS)
     
     enhancement_service = EnhancementService()
     
@@ -66,9 +149,17 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"Failed to initialize email service: {e}")
     
+    job_service = JobService(
+        workers=settings.JOB_WORKERS,
+        max_queue_size=settings.JOB_QUEUE_SIZE,
+        result_ttl_seconds=settings.JOB_RESULT_TTL_SECONDS
+    )
+    await job_service.start()
+    
     app.state.storage_service = storage_service
     app.state.enhancement_service = enhancement_service
     app.state.email_service = email_service
+    app.state.job_service = job_service
     
     # Seed menu data if needed
     try:
@@ -79,6 +170,8 @@ async def lifespan(app: FastAPI):
     yield
     
     logger.info("Shutting down application...")
+    await job_service.stop()
+    image_pool.shutdown()
 
 def setup_static_files(app):
     sqladmin_static_paths = [
@@ -117,6 +210,7 @@ def create_app() -> FastAPI:
     )
     
     app.add_middleware(HTTPSRedirectMiddleware)
+    app.add_middleware(UploadSizeLimitMiddleware, max_bytes=settings.UPLOAD_MAX_BYTES, batch_files=settings.BATCH_MAX_FILES)
     
     app.include_router(enhancement_router, prefix="/api")
     app.include_router(purchase_router, prefix="/api")
@@ -127,6 +221,8 @@ def create_app() -> FastAPI:
     app.include_router(filters_router, prefix="/api")
     app.include_router(custom_edits_router, prefix="/api")
     app.include_router(debug_router, prefix="/api")
+    app.include_router(jobs_router, prefix="/api")
+    app.include_router(metrics_router, prefix="/api")
     
     @app.get("/health")
     async def health_check():
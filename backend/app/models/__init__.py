@@ -1,9 +1,10 @@
-from .database import User, Purchase, Enhancement, AnalyticsEvent, EmailVerification, LinkedDevice, MenuItem, MenuSection, MenuVersion, MenuDeployment, SessionLocal, engine, Base, get_db
+from .database import User, Purchase, Enhancement, IdempotencyKey, AnalyticsEvent, EmailVerification, LinkedDevice, MenuItem, MenuSection, MenuVersion, MenuDeployment, SessionLocal, engine, Base, get_db
 
 __all__ = [
     "User",
     "Purchase", 
     "Enhancement",
+    "IdempotencyKey",
     "AnalyticsEvent",
     "EmailVerification",
     "LinkedDevice",
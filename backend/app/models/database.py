@@ -118,6 +118,22 @@ class Enhancement(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     processing_time = Column(Float)
     watermark = Column(Boolean, default=True)
+    processing_tier = Column(String, default="model")  # "model" or "local"
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    
+    id = Column(String, primary_key=True, index=True)  # sha256 of user id and key
+    user_id = Column(String, index=True)
+    key = Column(String)
+    endpoint = Column(String)
+    fingerprint = Column(String)  # hash of the request parameters
+    status = Column(String, default="processing")  # 'processing' or 'completed'
+    job_id = Column(String, nullable=True)  # set when the request was queued as a job
+    status_code = Column(Integer, nullable=True)
+    response = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True)
 
 class AnalyticsEvent(Base):
     __tablename__ = "analytics"
@@ -7,5 +7,7 @@ from .menu_configuration import router as menu_configuration_router
 from .filters import router as filters_router
 from .custom_edits import router as custom_edits_router
 from .debug import router as debug_router
+from .jobs import router as jobs_router
+from .metrics import router as metrics_router
 
-__all__ = ["enhancement_router", "purchase_router", "analytics_router", "user_router", "email_router", "menu_configuration_router", "filters_router", "custom_edits_router", "debug_router"]
\ No newline at end of file
+__all__ = ["enhancement_router", "purchase_router", "analytics_router", "user_router", "email_router", "menu_configuration_router", "filters_router", "custom_edits_router", "debug_router", "jobs_router", "metrics_router"]
\ No newline at end of file
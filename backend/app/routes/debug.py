@@ -6,12 +6,17 @@ import logging
 from PIL import Image
 from ..models import get_db
 from ..services import EnhancementService, StorageService
+from ..dependencies import get_enhancement_service, get_storage_service
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.post("/debug/validate-image")
-async def validate_image(file: UploadFile = File(...)):
+async def validate_image(
+    file: UploadFile = File(...),
+    enhancement_service: EnhancementService = Depends(get_enhancement_service),
+    storage_service: StorageService = Depends(get_storage_service)
+):
     """
     Debug endpoint to validate an image at each processing stage
     Returns detailed information about the image at each step
@@ -47,7 +52,6 @@ async def validate_image(file: UploadFile = File(...)):
             return JSONResponse(content=results, status_code=200)
 
         # Stage 2: PNG Conversion
-        enhancement_service = EnhancementService()
         try:
             png_data = enhancement_service.convert_to_png(image_data)
             results["png_conversion"]["size_bytes"] = len(png_data)
@@ -86,7 +90,6 @@ async def validate_image(file: UploadFile = File(...)):
             enhanced_data = png_data
 
         # Stage 4: Storage Upload
-        storage_service = StorageService()
         try:
             # Upload enhanced image
             enhanced_key = storage_service.upload_image(enhanced_data, "debug")
@@ -144,11 +147,10 @@ async def validate_image(file: UploadFile = File(...)):
 
 
 @router.get("/debug/test-storage/{key:path}")
-async def test_storage_retrieval(key: str):
+async def test_storage_retrieval(key: str, storage_service: StorageService = Depends(get_storage_service)):
     """
     Debug endpoint to test retrieving an image from storage and validating it
     """
-    storage_service = StorageService()
 
     try:
         # Retrieve image
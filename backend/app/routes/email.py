@@ -5,14 +5,10 @@ from datetime import datetime, timedelta
 import uuid
 import re
 
+from ..dependencies import get_email_service
 from ..models import get_db, LinkedDevice
 from ..schemas.requests import EmailVerificationRequest
 from ..schemas.responses import DeviceResponse, EmailVerificationResponse, DeviceListResponse, DeviceRemoveRequest
-try:
-    from email_service import EmailService
-except ImportError:
-    # Fallback if email service is not available
-    EmailService = None
 
 router = APIRouter()
 
@@ -24,7 +20,8 @@ def validate_email(email: str) -> bool:
 @router.post("/email/send-verification", response_model=EmailVerificationResponse)
 async def send_verification_code(
     request: EmailVerificationRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    email_service = Depends(get_email_service)
 ):
     """Send verification code to email for device linking"""
     
@@ -48,7 +45,6 @@ async def send_verification_code(
     verification_code = ''.join([str(uuid.uuid4().int)[:6]])
     
     # Try to send email
-    email_service = EmailService()
     email_sent = await email_service.send_verification_email(
         request.email, 
         verification_code, 
@@ -156,7 +152,8 @@ async def remove_device(
     request: DeviceRemoveRequest,
     x_email: str = Header(..., alias="X-Email"),
     x_device_id: str = Header(..., alias="X-Device-ID"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    email_service = Depends(get_email_service)
 ):
     """Remove a device from the account"""
     
@@ -178,7 +175,6 @@ async def remove_device(
     
     try:
         # Send notification email (optional)
-        email_service = EmailService()
         await email_service.send_device_removed_email(
             x_email, 
             device_to_remove.device_name
@@ -1,129 +1,337 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Header, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+import asyncio
+import json
+import time
 import logging
-from io import BytesIO
-from ..models import get_db, Enhancement
+import mimetypes
+from email.utils import format_datetime
+from ..models import get_db, Enhancement, IdempotencyKey, User, SessionLocal
+from ..config.settings import settings
 from ..services import UserService, EnhancementService, StorageService
+from ..services.enhancement_service import TIER_MODEL
+from ..services.image_context import ImageContext
+from ..services.upload_ingest import upload_ingest
+from ..services.image_process_pool import image_pool
+from ..services import image_tasks
+from ..services.enhancement_pipeline import process_enhancement
+from ..services.idempotency_service import IdempotencyService, IdempotencyStatus, idempotency_service
 from ..schemas.requests import EnhanceRequest
 from ..schemas.responses import EnhancementResponse
+from ..dependencies import get_enhancement_service, get_job_service, get_storage_service
+from ..utils.http_cache import RangeNotSatisfiable, is_immutable_key, not_modified, parse_range
+from .jobs import job_submitted_response
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.post("/enhance", response_model=EnhancementResponse)
 async def enhance_image(
+    request: Request,
     user_id: str = Form(...),
     mode: str = Form("enhance"),
     file: UploadFile = File(...),
     resolution: str = Form("standard"),
+    async_mode: bool = Form(False),
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    logger.info(f"Received enhance request: user_id={user_id}, mode={mode}, resolution={resolution}, filename={file.filename}, content_type={file.content_type}")
+    logger.info(f"Received enhance request: user_id={user_id}, mode={mode}, resolution={resolution}, async_mode={async_mode}, filename={file.filename}, content_type={file.content_type}")
+
+    try:
+        return await run_upload(request, db, "enhance", user_id, file, mode, resolution, async_mode, idempotency_key=idempotency_key)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing enhance request: {e}", exc_info=True)
+        raise HTTPException(status_code=422, detail=f"Invalid request data: {e}")
+
+async def run_upload(
+    request: Request,
+    db: Session,
+    kind: str,
+    user_id: str,
+    file: UploadFile,
+    mode: str,
+    resolution: str,
+    async_mode: bool,
+    filter_type: Optional[str] = None,
+    custom_prompt: Optional[str] = None,
+    idempotency_key: Optional[str] = None
+) -> Union[EnhancementResponse, JSONResponse]:
+    """
+    Credit check, upload intake and the shared pipeline for a single-image
+    request, run inline or as a background job of the given kind. With an
+    Idempotency-Key, a replay of the key gets the first request's response.
+    """
+    enhancement_service = get_enhancement_service(request)
+    storage_service = get_storage_service(request)
+    record_id = None
+    # Once processing is handed to a job or a key's task, that owns completing or releasing the key
+    handed_off = False
+    if idempotency_key:
+        fingerprint = IdempotencyService.fingerprint(
+            kind, user_id=user_id, mode=mode, resolution=resolution, filter_type=filter_type, custom_prompt=custom_prompt
+        )
+        record, claimed = idempotency_service.claim(db, user_id, idempotency_key, kind, fingerprint)
+        if not claimed:
+            logger.info(f"Replaying {kind} request for user {user_id} with idempotency key {idempotency_key}")
+            return await replay_response(request, db, record)
+        record_id = record.id
 
     try:
         user = UserService.get_or_create_user(db, user_id)
-        
-        if not UserService.has_credits(user):
-            logger.warning(f"User {user_id} has no credits available for enhancement.")
+
+        has_credits = UserService.has_credits(user)
+        tier = EnhancementService.select_tier(mode, has_credits)
+        if tier == TIER_MODEL and not has_credits:
+            logger.warning(f"User {user_id} has no credits available for {kind}.")
             raise HTTPException(status_code=403, detail="No credits available")
-        
-        start_time = datetime.utcnow()
-        
-        image_data = await file.read()
-        
-        enhancement_service = EnhancementService()
-        storage_service = StorageService()
-        
-        image_data = enhancement_service.convert_to_png(image_data)
-        
-        logger.info(f"Starting enhancement - User: {user_id}, Mode: {mode}, Resolution: {resolution}, "
-                   f"File Size: {len(image_data)/1024:.1f}KB")
-        
-        try:
-            enhanced_data = await enhancement_service.enhance_image(image_data, resolution, mode)
 
-            UserService.deduct_credits(user)
+        upload_start = time.monotonic()
+        source = await upload_ingest.ingest(file)
+        upload_ms = round((time.monotonic() - upload_start) * 1000, 1)
 
+        async def process(process_db: Session, process_user: User) -> EnhancementResponse:
             try:
-                # Generate multiple sizes and blurhash
-                enhanced_sizes = enhancement_service.generate_multiple_sizes(enhanced_data)
-                blurhash = enhancement_service.generate_blurhash(enhanced_data)
+                response = await process_enhancement(
+                    process_db, process_user, mode, resolution, source, file.filename,
+                    enhancement_service, storage_service, tier=tier, filter_type=filter_type, custom_prompt=custom_prompt
+                )
+                if record_id:
+                    idempotency_service.complete(process_db, record_id, 200, response.model_dump(mode="json"))
+                return response
+            except BaseException:
+                if record_id:
+                    idempotency_service.release(process_db, record_id)
+                raise
+            finally:
+                source.close()
 
-                # Upload all sizes
-                image_keys = storage_service.upload_multi_size_images(image_data, enhanced_sizes)
+        if async_mode:
+            async def run_job(job_db: Session) -> EnhancementResponse:
+                return await process(job_db, UserService.get_or_create_user(job_db, user_id))
 
-                logger.info(f"Multi-size images and blurhash generated successfully.")
-            except Exception as e:
-                logger.error(f"Storage error for user {user_id}, file {file.filename}: {e}", exc_info=True)
-                UserService.refund_credits(user)
-                db.commit()
-                raise HTTPException(status_code=500, detail=f"Storage error: {str(e)}")
-            
-            processing_time = (datetime.utcnow() - start_time).total_seconds()
-            
-            watermark = (
-                user.credits == 0 and 
-                (not user.subscription_type or user.subscription_expires <= datetime.utcnow())
-            )
-            
-            enhancement = Enhancement(
-                user_id=user_id,
-                original_url=image_keys['original_url'],
-                enhanced_url=image_keys['enhanced_url'],
-                thumbnail_url=image_keys.get('thumbnail_url'),
-                preview_url=image_keys.get('preview_url'),
-                blurhash=blurhash,
-                resolution=resolution,
-                mode=mode,
-                processing_time=processing_time,
-                watermark=watermark
-            )
-            db.add(enhancement)
-            db.commit()
-            
-            logger.info(f"Enhancement completed successfully - User: {user_id}, Enhancement ID: {enhancement.id}, "
-                       f"Mode: {mode}, Resolution: {resolution}, "
-                       f"Processing Time: {processing_time:.2f}s, Watermark: {watermark}, "
-                       f"File Size: {len(image_data)/1024:.1f}KB -> {len(enhanced_data)/1024:.1f}KB")
-            
-            credits_info = UserService.get_credits_info(user)
-            
-            return EnhancementResponse(
-                enhancement_id=enhancement.id,
-                enhanced_url=storage_service.get_presigned_url(image_keys['enhanced_url']),
-                thumbnail_url=storage_service.get_presigned_url(image_keys.get('thumbnail_url')) if image_keys.get('thumbnail_url') else None,
-                preview_url=storage_service.get_presigned_url(image_keys.get('preview_url')) if image_keys.get('preview_url') else None,
-                blurhash=blurhash,
-                watermark=watermark,
-                processing_time=processing_time,
-                remaining_credits=credits_info["total_credits"],
-                remaining_today=credits_info["remaining_today"]
+            try:
+                job = get_job_service(request).submit(kind, user_id, run_job)
+            except BaseException:
+                # A rejected job never runs process(), which would close the upload
+                source.close()
+                raise
+            job.progress.emit("stage", stage="upload", status="completed", duration_ms=upload_ms, bytes=len(source.data))
+            handed_off = True
+            if record_id:
+                idempotency_service.attach_job(db, record_id, job.id)
+            return job_submitted_response(job)
+
+        if record_id:
+            # Replays of the key that arrive meanwhile wait for this result. The
+            # task keeps running if this client disconnects, so it works on a
+            # session of its own rather than the request's.
+            async def run_keyed() -> EnhancementResponse:
+                task_db = SessionLocal()
+                try:
+                    return await process(task_db, UserService.get_or_create_user(task_db, user_id))
+                finally:
+                    task_db.close()
+
+            handed_off = True
+            return await idempotency_service.run(record_id, run_keyed)
+        return await process(db, user)
+    except BaseException:
+        if record_id and not handed_off:
+            idempotency_service.release(db, record_id)
+        raise
+
+async def replay_response(request: Request, db: Session, record: IdempotencyKey) -> JSONResponse:
+    """Response for a replayed Idempotency-Key: the running job, the stored response or the running request"""
+    job = get_job_service(request).get(record.job_id) if record.job_id else None
+    if job:
+        idempotency_service.attached += 1
+        response = job_submitted_response(job)
+    elif record.status == IdempotencyStatus.COMPLETED:
+        idempotency_service.replayed += 1
+        response = JSONResponse(status_code=record.status_code, content=refresh_urls(db, get_storage_service(request), record.response))
+    else:
+        task = idempotency_service.running(record.id)
+        if task is None:
+            # Still processing in another worker process
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still being processed",
+                headers={"Retry-After": "5"}
             )
-            
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Image enhancement failed for user {user_id}, file {file.filename}: {e}", exc_info=True)
-            db.rollback()
-            error_message = str(e)
-            if "Gemini enhancement failed" in error_message:
-                raise HTTPException(status_code=500, detail=error_message)
-            else:
-                raise HTTPException(status_code=500, detail=f"Enhancement failed: {error_message}")
+        idempotency_service.attached += 1
+        result = await asyncio.shield(task)
+        response = JSONResponse(content=result.model_dump(mode="json"))
+
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+def refresh_urls(db: Session, storage_service: StorageService, body: Dict[str, Any]) -> Dict[str, Any]:
+    """Stored response with newly presigned image URLs, as the stored ones may have expired"""
+    enhancement = db.get(Enhancement, body.get("enhancement_id")) if body.get("enhancement_id") else None
+    if enhancement is None:
+        return body
+    return {
+        **body,
+        "enhanced_url": storage_service.get_presigned_url(enhancement.enhanced_url),
+        "thumbnail_url": storage_service.get_presigned_url(enhancement.thumbnail_url) if enhancement.thumbnail_url else None,
+        "preview_url": storage_service.get_presigned_url(enhancement.preview_url) if enhancement.preview_url else None,
+    }
+
+@router.post("/enhance/batch")
+async def enhance_batch(
+    user_id: str = Form(...),
+    files: List[UploadFile] = File(...),
+    modes: List[str] = Form(["enhance"]),
+    resolution: str = Form("standard"),
+    db: Session = Depends(get_db),
+    enhancement_service: EnhancementService = Depends(get_enhancement_service),
+    storage_service: StorageService = Depends(get_storage_service)
+):
+    """
+    Enhance several images in one request.
+
+    `modes` is either a single mode applied to every file or one mode per
+    file, in upload order. Credits for all valid files served by the model
+    are reserved up front, the files are enhanced concurrently and each
+    result is streamed back as an NDJSON line as soon as it finishes. Failed
+    items are refunded; files rejected at upload, and files served by the
+    local tier, are never charged.
+    """
+    logger.info(f"Received batch enhance request: user_id={user_id}, files={len(files)}, modes={modes}, resolution={resolution}")
+
+    if len(files) > settings.BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {settings.BATCH_MAX_FILES} files")
+    if len(modes) == 1:
+        modes = modes * len(files)
+    elif len(modes) != len(files):
+        raise HTTPException(status_code=400, detail="Provide either one mode or one mode per file")
+
+    items: List[Tuple[str, Union[ImageContext, HTTPException]]] = []
+    try:
+        # Ingest every upload before streaming starts; the upload files are closed with the request
+        for file in files:
+            try:
+                items.append((file.filename, await upload_ingest.ingest(file)))
+            except HTTPException as e:
+                items.append((file.filename, e))
+        user = UserService.get_or_create_user(db, user_id)
+
+        has_credits = UserService.has_credits(user)
+        tiers = [EnhancementService.select_tier(mode, has_credits) for mode in modes]
+        charged = sum(
+            1 for (_, source), tier in zip(items, tiers)
+            if isinstance(source, ImageContext) and tier == TIER_MODEL
+        )
+
+        if not UserService.reserve_credits(user, charged):
+            logger.warning(f"User {user_id} does not have {charged} credits for a batch enhancement.")
+            raise HTTPException(status_code=403, detail=f"Not enough credits for {charged} images")
+        db.commit()
     except Exception as e:
-        logger.error(f"Error processing enhance request: {e}", exc_info=True)
+        for _, source in items:
+            if isinstance(source, ImageContext):
+                source.close()
+        if isinstance(e, HTTPException):
+            raise
+        logger.error(f"Error processing batch enhance request: {e}", exc_info=True)
+        db.rollback()
         raise HTTPException(status_code=422, detail=f"Invalid request data: {e}")
 
+    return StreamingResponse(
+        stream_batch_results(user_id, items, modes, tiers, resolution, enhancement_service, storage_service),
+        media_type="application/x-ndjson"
+    )
+
+async def stream_batch_results(
+    user_id: str,
+    items: List[Tuple[str, Union[ImageContext, HTTPException]]],
+    modes: List[str],
+    tiers: List[str],
+    resolution: str,
+    enhancement_service: EnhancementService,
+    storage_service: StorageService
+) -> AsyncIterator[str]:
+    """Process batch items with bounded concurrency, yielding one NDJSON line per finished item"""
+    slots = asyncio.Semaphore(max(1, settings.BATCH_MAX_CONCURRENCY))
+    start_time = datetime.utcnow()
+
+    async def run_item(index: int, filename: str, source: Union[ImageContext, HTTPException], mode: str, tier: str) -> Dict[str, Any]:
+        if isinstance(source, HTTPException):
+            return {"index": index, "filename": filename, "mode": mode, "status": "failed", "error": source.detail, "error_status": source.status_code}
+
+        async with slots:
+            # One session per item: a failing item's rollback must not discard the others' rows
+            db = SessionLocal()
+            try:
+                user = UserService.get_or_create_user(db, user_id)
+                result = await process_enhancement(
+                    db, user, mode, resolution, source, filename, enhancement_service, storage_service,
+                    credit_reserved=tier == TIER_MODEL, tier=tier
+                )
+                return {"index": index, "filename": filename, "mode": mode, "status": "completed", "result": result.model_dump()}
+            except Exception as e:
+                status_code = e.status_code if isinstance(e, HTTPException) else 500
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                logger.warning(f"Batch item {index} ({filename}) failed for user {user_id}: {detail}")
+                db.rollback()
+                if tier == TIER_MODEL:
+                    user = UserService.get_or_create_user(db, user_id)
+                    UserService.refund_credits(user)
+                    db.commit()
+                return {"index": index, "filename": filename, "mode": mode, "status": "failed", "error": detail, "error_status": status_code}
+            finally:
+                source.close()
+                db.close()
+
+    tasks = [
+        asyncio.create_task(run_item(index, filename, source, mode, tier))
+        for index, ((filename, source), mode, tier) in enumerate(zip(items, modes, tiers))
+    ]
+    completed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            line = await next_done
+            if line["status"] == "completed":
+                completed += 1
+            yield json.dumps(line, default=str) + "\n"
+
+        db = SessionLocal()
+        try:
+            credits_info = UserService.get_credits_info(UserService.get_or_create_user(db, user_id))
+        finally:
+            db.close()
+        processing_time = (datetime.utcnow() - start_time).total_seconds()
+        logger.info(f"Batch enhancement finished - User: {user_id}, Completed: {completed}/{len(items)}, "
+                   f"Processing Time: {processing_time:.2f}s")
+        yield json.dumps({
+            "status": "done",
+            "completed": completed,
+            "failed": len(items) - completed,
+            "processing_time": processing_time,
+            "remaining_credits": credits_info["total_credits"],
+            "remaining_today": credits_info["remaining_today"]
+        }) + "\n"
+    finally:
+        # If the client went away, the remaining items still finish (and refund
+        # their credit on failure), each closing its own session
+        pending = [task for task in tasks if not task.done()]
+        if pending:
+            logger.info(f"Batch stream for user {user_id} closed with {len(pending)} items still running")
+
 @router.get("/enhancements/{user_id}")
 async def get_user_enhancements(
     user_id: str,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    storage_service: StorageService = Depends(get_storage_service)
 ):
     """Get all enhancements for a specific user"""
     try:
-        storage_service = StorageService()
         enhancements = db.query(Enhancement).filter(Enhancement.user_id == user_id).order_by(Enhancement.created_at.desc()).all()
 
         return [
@@ -139,6 +347,7 @@ async def get_user_enhancements(
                 "mode": enhancement.mode,
                 "created_at": enhancement.created_at,
                 "processing_time": enhancement.processing_time,
+                "processing_tier": enhancement.processing_tier or "model",
                 "watermark": enhancement.watermark
             }
             for enhancement in enhancements
@@ -148,19 +357,66 @@ async def get_user_enhancements(
         raise HTTPException(status_code=500, detail=f"Error fetching enhancements: {str(e)}")
 
 @router.get("/image/{key:path}")
-async def get_image(key: str, thumbnail: bool = False):
+async def get_image(
+    key: str,
+    request: Request,
+    thumbnail: bool = False,
+    storage_service: StorageService = Depends(get_storage_service)
+):
+    """
+    Stored image, streamed from MinIO in chunks. Sends the object's ETag and
+    Last-Modified, answers conditional requests with 304 and serves single
+    byte ranges. Objects named by a uuid never change, so they are cached as
+    immutable; thumbnails are rendered on request and not range-capable.
+    """
     from minio.error import S3Error
 
-    storage_service = StorageService()
-
     try:
-        image_data = storage_service.get_image(key)
+        stat = await asyncio.to_thread(storage_service.stat_image, key)
+    except S3Error:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = f'"{stat.etag}-thumbnail"' if thumbnail else f'"{stat.etag}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.IMAGE_CACHE_MAX_AGE_SECONDS}, immutable" if is_immutable_key(key) else "no-cache"
+    }
+    if stat.last_modified:
+        headers["Last-Modified"] = format_datetime(stat.last_modified, usegmt=True)
 
+    if not_modified(request.headers.get("if-none-match"), request.headers.get("if-modified-since"), etag, stat.last_modified):
+        return Response(status_code=304, headers=headers)
+
+    try:
         if thumbnail:
-            enhancement_service = EnhancementService()
-            thumbnail_data = enhancement_service.generate_thumbnail(image_data)
-            return StreamingResponse(BytesIO(thumbnail_data), media_type="image/png")
-        else:
-            return StreamingResponse(BytesIO(image_data), media_type="image/png")
+            image_data = await asyncio.to_thread(storage_service.get_image, key)
+            thumbnail_data = await image_pool.run(image_tasks.thumbnail, image_data)
+            return Response(thumbnail_data, media_type="image/png", headers=headers)
+
+        headers["Accept-Ranges"] = "bytes"
+        try:
+            byte_range = parse_range(request.headers.get("range"), stat.size)
+        except RangeNotSatisfiable:
+            raise HTTPException(
+                status_code=416,
+                detail="Requested range not satisfiable",
+                headers={"Content-Range": f"bytes */{stat.size}"}
+            )
+        if_range = request.headers.get("if-range")
+        if byte_range and if_range and if_range != etag:
+            # The client's copy is outdated; send the whole object instead of a part of it
+            byte_range = None
+
+        status_code, offset, length = 200, 0, stat.size
+        if byte_range:
+            status_code, offset, length = 206, byte_range[0], byte_range[1] - byte_range[0] + 1
+            headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{stat.size}"
+        headers["Content-Length"] = str(length)
+
+        chunks = await asyncio.to_thread(
+            storage_service.stream_image, key, offset, length if byte_range else 0, settings.IMAGE_STREAM_CHUNK_BYTES
+        )
+        media_type = mimetypes.guess_type(key)[0] or stat.content_type or "image/png"
+        return StreamingResponse(chunks, status_code=status_code, media_type=media_type, headers=headers)
     except S3Error:
-        raise HTTPException(status_code=404, detail="Image not found")
\ No newline at end of file
+        raise HTTPException(status_code=404, detail="Image not found")
@@ -0,0 +1,83 @@
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
+import json
+import logging
+from ..services.job_service import Job
+from ..schemas.responses import JobStatusResponse, JobSubmittedResponse
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+def job_submitted_response(job: Job) -> JSONResponse:
+    """202 response returned by image endpoints when called with async_mode"""
+    owner = f"user_id={quote(job.user_id, safe='')}"
+    body = JobSubmittedResponse(
+        job_id=job.id,
+        status=job.status,
+        status_url=f"/api/jobs/{job.id}?{owner}",
+        events_url=f"/api/jobs/{job.id}/events?{owner}"
+    )
+    return JSONResponse(status_code=202, content=body.model_dump())
+
+def get_user_job(request: Request, job_id: str, user_id: str) -> Job:
+    """The job, if it belongs to user_id; other users' jobs are reported as not found"""
+    job = request.app.state.job_service.get(job_id)
+    if not job or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(
+    job_id: str,
+    request: Request,
+    user_id: str = Query(..., description="User who submitted the job"),
+    wait: float = Query(0, ge=0, le=60, description="Seconds to wait for the job to finish before answering")
+):
+    """Get the status of an enhancement job, optionally long-polling until it finishes"""
+    job = get_user_job(request, job_id, user_id)
+    job = await request.app.state.job_service.wait(job, wait)
+
+    return JobStatusResponse(
+        job_id=job.id,
+        kind=job.kind,
+        status=job.status,
+        stage=job.progress.stage,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        result=job.result,
+        error=job.error,
+        error_status=job.error_status
+    )
+
+@router.get("/jobs/{job_id}/events")
+async def get_job_events(
+    job_id: str,
+    request: Request,
+    user_id: str = Query(..., description="User who submitted the job"),
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Server-Sent Events stream of a job's progress: status changes, stage
+    timings, the blurhash and preview URL as soon as they exist, and a final
+    completed or failed event carrying the result. Events already emitted
+    are replayed first; reconnecting clients resume after Last-Event-ID.
+    """
+    job = get_user_job(request, job_id, user_id)
+
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else -1
+    return StreamingResponse(
+        stream_job_events(job, after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def stream_job_events(job: Job, after: int) -> AsyncIterator[str]:
+    async for event in job.progress.follow(after):
+        if event is None:
+            # Comment line keeps proxies from closing an idle stream
+            yield ": keep-alive\n\n"
+            continue
+        yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends, Request
+import logging
+from ..services.result_cache import result_cache
+from ..services.enhancement_service import enhancement_flights
+from ..services.image_process_pool import image_pool
+from ..services.upload_ingest import upload_ingest
+from ..services.upstream_quota import upstream_quota
+from ..services.upstream_resilience import upstream_resilience
+from ..services.tiled_enhancement import tiled_enhancer
+from ..services.idempotency_service import idempotency_service
+from ..services.storage_service import upload_stats
+from ..services.presigned_url_cache import presigned_url_cache
+from ..dependencies import require_metrics_token
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+@router.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def get_metrics(request: Request):
+    """Runtime counters for the image processing pipeline, for operators holding METRICS_TOKEN"""
+    job_service = getattr(request.app.state, "job_service", None)
+
+    return {
+        "result_cache": result_cache.stats(),
+        "single_flight": enhancement_flights.stats(),
+        "image_pool": image_pool.stats(),
+        "upload_ingest": upload_ingest.stats(),
+        "upstream": upstream_quota.stats(),
+        "resilience": upstream_resilience.stats(),
+        "tiling": tiled_enhancer.stats(),
+        "idempotency": idempotency_service.stats(),
+        "storage_uploads": upload_stats.stats(),
+        "presigned_urls": presigned_url_cache.stats(),
+        "jobs": job_service.stats() if job_service else None
+    }
@@ -2,16 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import List, Dict
-import sys
-
-# Import from backend root directory
-sys.path.append('/app')
-try:
-    from email_service import EmailService
-except ImportError:
-    # Fallback if email service is not available
-    EmailService = None
 
+from ..dependencies import get_email_service
 from ..models import get_db, EmailVerification, LinkedDevice, User
 from ..services import UserService
 from ..schemas.requests import EmailVerificationRequest, VerifyCodeRequest, RemoveDeviceRequest
@@ -22,10 +14,9 @@ router = APIRouter()
 @router.post("/email/send-verification", response_model=EmailVerificationResponse)
 async def send_verification_code(
     request: EmailVerificationRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    email_service = Depends(get_email_service)
 ):
-    email_service = EmailService()
-    
     existing_device = db.query(LinkedDevice).filter(
         LinkedDevice.device_id == request.device_id
     ).first()
@@ -131,7 +122,8 @@ async def get_linked_devices(
 @router.post("/email/remove-device", response_model=RemoveDeviceResponse)
 async def remove_device(
     request: RemoveDeviceRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    email_service = Depends(get_email_service)
 ):
     requesting_device = db.query(LinkedDevice).filter(
         LinkedDevice.device_id == request.requesting_device_id,
@@ -153,7 +145,6 @@ async def remove_device(
     db.delete(device_to_remove)
     db.commit()
     
-    email_service = EmailService()
     await email_service.send_device_removed_email(request.email, device_name)
     
     return RemoveDeviceResponse(
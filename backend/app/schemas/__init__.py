@@ -10,6 +10,8 @@ from .requests import (
 
 from .responses import (
     EnhancementResponse,
+    JobSubmittedResponse,
+    JobStatusResponse,
     PurchaseResponse,
     RestoreResponse,
     AnalyticsResponse,
@@ -36,6 +38,8 @@ __all__ = [
     "VerifyCodeRequest",
     "RemoveDeviceRequest",
     "EnhancementResponse",
+    "JobSubmittedResponse",
+    "JobStatusResponse",
     "PurchaseResponse",
     "RestoreResponse", 
     "AnalyticsResponse",
@@ -10,9 +10,28 @@ class EnhancementResponse(BaseModel):
     blurhash: Optional[str] = None
     watermark: bool
     processing_time: float
+    processing_tier: str = "model"
     remaining_credits: int
     remaining_today: int
 
+class JobSubmittedResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+    events_url: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    stage: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[EnhancementResponse] = None
+    error: Optional[str] = None
+    error_status: Optional[int] = None
+
 class PurchaseResponse(BaseModel):
     success: bool
     purchase_id: str
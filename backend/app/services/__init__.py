@@ -3,11 +3,18 @@ from .storage_service import StorageService
 from .enhancement_service import EnhancementService
 from .analytics_service import AnalyticsService
 from .menu_configuration_service import MenuConfigurationService
+from .job_service import JobService, JobStatus
+from .result_cache import EnhancementResultCache, CachedResult, result_cache
 
 __all__ = [
     "UserService",
     "StorageService", 
     "EnhancementService",
     "AnalyticsService",
-    "MenuConfigurationService"
+    "MenuConfigurationService",
+    "JobService",
+    "JobStatus",
+    "EnhancementResultCache",
+    "CachedResult",
+    "result_cache"
 ]
\ No newline at end of file
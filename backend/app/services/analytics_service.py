@@ -42,6 +42,7 @@ class AnalyticsService:
                 "mode": e.mode if hasattr(e, 'mode') else "enhance",
                 "created_at": e.created_at.isoformat(),
                 "processing_time": e.processing_time,
+                "processing_tier": e.processing_tier or "model",
                 "watermark": e.watermark
             })
         
@@ -88,6 +89,7 @@ class AnalyticsService:
                 "mode": e.mode if hasattr(e, 'mode') else "enhance",
                 "created_at": e.created_at.isoformat(),
                 "processing_time": e.processing_time,
+                "processing_tier": e.processing_tier or "model",
                 "watermark": e.watermark
             })
         
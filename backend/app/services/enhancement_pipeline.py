@@ -0,0 +1,212 @@
+"""
+The processing pipeline shared by /enhance, /filter and /custom-edit.
+
+Every request runs the same steps: the enhancement itself (model or local
+tier), the stored variants (thumbnail, preview, full) with their blurhash,
+the upload of the original and the variants, and the history row. List
+views can therefore always use the stored thumbnail and preview instead of
+resizing the full image on the fly.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional, Union
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from ..models import Enhancement, User
+from ..schemas.responses import EnhancementResponse
+from .user_service import UserService
+from .storage_service import StorageService, ResultUpload
+from .enhancement_service import EnhancementService, TIER_MODEL
+from .result_cache import result_cache, CachedResult
+from .image_context import ImageContext
+from .progress import report, stage
+
+logger = logging.getLogger(__name__)
+
+# Log and error message label per mode; everything else is an enhancement
+MODE_LABELS = {
+    "filter": "Filter application",
+    "custom-edit": "Custom edit",
+}
+
+
+def describe(mode: str, filter_type: Optional[str] = None, custom_prompt: Optional[str] = None) -> str:
+    """Request parameters for log lines"""
+    if mode == "filter":
+        return f"Filter: {filter_type}"
+    if mode == "custom-edit":
+        return f"Description: '{custom_prompt}'"
+    return f"Mode: {mode}"
+
+
+async def process_enhancement(
+    db: Session,
+    user: User,
+    mode: str,
+    resolution: str,
+    image: Union[bytes, ImageContext],
+    filename: str,
+    enhancement_service: EnhancementService,
+    storage_service: StorageService,
+    credit_reserved: bool = False,
+    tier: str = TIER_MODEL,
+    filter_type: Optional[str] = None,
+    custom_prompt: Optional[str] = None
+) -> EnhancementResponse:
+    """
+    Run enhancement, variant generation and storage for one uploaded image,
+    on the application's shared enhancement and storage services.
+
+    With credit_reserved the credit was already taken by the caller (batch
+    requests), which then also owns refunding it when this raises. The
+    local tier never charges a credit.
+    """
+    user_id = user.id
+    start_time = datetime.utcnow()
+    label = MODE_LABELS.get(mode, "Enhancement")
+    params = describe(mode, filter_type, custom_prompt)
+
+    # Header-only probe; pixels are decoded once, downscaled, inside enhance_image
+    if isinstance(image, ImageContext):
+        source = image
+    else:
+        try:
+            source = ImageContext.probe(image)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Starting {label.lower()} - User: {user_id}, {params}, Resolution: {resolution}, Tier: {tier}, "
+               f"File Size: {len(source.data)/1024:.1f}KB")
+
+    charge = tier == TIER_MODEL and not credit_reserved
+    cache_key = result_cache.make_key(
+        source.data, mode=mode, resolution=resolution, filter_type=filter_type, custom_prompt=custom_prompt, tier=tier,
+        user_id=user_id
+    )
+    cached = result_cache.get(cache_key)
+
+    try:
+        if cached:
+            # Identical image and parameters were processed before; reuse the stored result
+            logger.info(f"Serving {label.lower()} from result cache - User: {user_id}, {params}, Resolution: {resolution}")
+            image_keys = cached.image_keys
+            blurhash = cached.blurhash
+            enhanced_size = cached.enhanced_size
+            if credit_reserved:
+                # Cached results are free, hand back the reserved credit
+                UserService.refund_credits(user)
+            report("blurhash", blurhash=blurhash)
+            report_preview(storage_service, image_keys, cached=True)
+        else:
+            enhanced_data = await enhancement_service.enhance_image(
+                source,
+                resolution,
+                mode,
+                filter_type=filter_type,
+                custom_prompt=custom_prompt,
+                tier=tier
+            )
+            enhanced_size = len(enhanced_data)
+
+            if charge:
+                UserService.deduct_credits(user)
+
+            upload = ResultUpload(storage_service)
+            try:
+                # Uploads start as soon as each object exists: the original and a
+                # model output that is stored as-is now, the variants once encoded
+                upload.put('original', source)
+                stored = enhancement_service.stored_as_is(enhanced_data)
+                for name, data in stored.items():
+                    upload.put(name, data)
+
+                with stage("variants"):
+                    enhanced_sizes, blurhash = await enhancement_service.render_variants(enhanced_data, skip=tuple(stored))
+                report("blurhash", blurhash=blurhash)
+
+                with stage("storage"):
+                    for name, data in enhanced_sizes.items():
+                        upload.put(name, data)
+                    # Announce the preview before the full size is stored
+                    report_preview(storage_service, await upload.wait('thumbnail', 'preview'))
+                    image_keys = await upload.wait()
+
+                logger.info(f"Multi-size images and blurhash generated successfully.")
+            except asyncio.CancelledError:
+                # Clean up in the background; the cancelled request cannot wait for it
+                asyncio.get_running_loop().run_in_executor(None, upload.abort)
+                raise
+            except Exception as e:
+                logger.error(f"Storage error for user {user_id}, file {filename}: {e}", exc_info=True)
+                await asyncio.to_thread(upload.abort)
+                if charge:
+                    UserService.refund_credits(user)
+                    db.commit()
+                raise HTTPException(status_code=500, detail=f"Storage error: {str(e)}")
+
+            result_cache.put(cache_key, CachedResult(image_keys=image_keys, blurhash=blurhash, enhanced_size=enhanced_size))
+
+        processing_time = (datetime.utcnow() - start_time).total_seconds()
+
+        watermark = (
+            user.credits == 0 and
+            (not user.subscription_type or user.subscription_expires <= datetime.utcnow())
+        )
+
+        enhancement = Enhancement(
+            user_id=user_id,
+            original_url=image_keys['original_url'],
+            enhanced_url=image_keys['enhanced_url'],
+            thumbnail_url=image_keys.get('thumbnail_url'),
+            preview_url=image_keys.get('preview_url'),
+            blurhash=blurhash,
+            resolution=resolution,
+            mode=mode,
+            processing_time=processing_time,
+            processing_tier=tier,
+            watermark=watermark
+        )
+        db.add(enhancement)
+        db.commit()
+
+        logger.info(f"{label} completed successfully - User: {user_id}, Enhancement ID: {enhancement.id}, "
+                   f"{params}, Resolution: {resolution}, Tier: {tier}, "
+                   f"Processing Time: {processing_time:.2f}s, Watermark: {watermark}, "
+                   f"File Size: {len(source.data)/1024:.1f}KB -> {enhanced_size/1024:.1f}KB, Cached: {cached is not None}")
+
+        credits_info = UserService.get_credits_info(user)
+
+        return EnhancementResponse(
+            enhancement_id=enhancement.id,
+            enhanced_url=storage_service.get_presigned_url(image_keys['enhanced_url']),
+            thumbnail_url=storage_service.get_presigned_url(image_keys.get('thumbnail_url')) if image_keys.get('thumbnail_url') else None,
+            preview_url=storage_service.get_presigned_url(image_keys.get('preview_url')) if image_keys.get('preview_url') else None,
+            blurhash=blurhash,
+            watermark=watermark,
+            processing_time=processing_time,
+            processing_tier=tier,
+            remaining_credits=credits_info["total_credits"],
+            remaining_today=credits_info["remaining_today"]
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"{label} failed for user {user_id}, file {filename}: {e}", exc_info=True)
+        db.rollback()
+        error_message = str(e)
+        if "Gemini enhancement failed" in error_message:
+            raise HTTPException(status_code=500, detail=error_message)
+        else:
+            raise HTTPException(status_code=500, detail=f"{label} failed: {error_message}")
+
+
+def report_preview(storage_service: StorageService, image_keys: Dict[str, str], cached: bool = False):
+    """Progress event with the preview and thumbnail URLs, once those variants are stored"""
+    report(
+        "preview",
+        preview_url=storage_service.get_presigned_url(image_keys.get('preview_url')) if image_keys.get('preview_url') else None,
+        thumbnail_url=storage_service.get_presigned_url(image_keys.get('thumbnail_url')) if image_keys.get('thumbnail_url') else None,
+        cached=cached
+    )
@@ -1,56 +1,172 @@
 import io
 import sys
+import math
+import asyncio
 import logging
+from dataclasses import dataclass
+from typing import Optional, Union
 from PIL import Image
 from fastapi import HTTPException
 
 # Import from backend root directory
 sys.path.append('/app')
-from image_enhancement import ImageEnhancer
+from image_enhancement import UpstreamRejected
+from ..utils.single_flight import SingleFlight
+from ..utils.blurhash import encode as encode_blurhash
+from .result_cache import EnhancementResultCache
+from .image_context import ImageContext
+from .image_process_pool import image_pool
+from .upstream_resilience import upstream_resilience
+from .enhancer_backend import create_enhancer_backend
+from .local_enhancer import local_enhancer
+from .tiled_enhancement import tiled_enhancer
+from .progress import stage
+from . import image_tasks
+from ..config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Identical requests that arrive while a model call is running share its result
+enhancement_flights = SingleFlight("gemini")
+
+# Processing tiers recorded on Enhancement.processing_tier
+TIER_MODEL = "model"
+TIER_LOCAL = "local"
+
+
+@dataclass(frozen=True)
+class ImageVariant:
+    """A stored rendition of an enhanced image"""
+    name: str
+    max_size: Optional[tuple[int, int]] = None  # None keeps the full resolution
+    format: str = 'PNG'
+    compress_level: int = 6
+
+    def encode(self, img: Image.Image) -> bytes:
+        buffer = io.BytesIO()
+        img.save(buffer, format=self.format, compress_level=self.compress_level)
+        return buffer.getvalue()
+
+
+# Ordered largest first
+IMAGE_VARIANTS = (
+    ImageVariant('full'),
+    ImageVariant('preview', (1080, 1080)),
+    ImageVariant('thumbnail', (200, 200)),
+)
+
+VARIANTS_BY_NAME = {variant.name: variant for variant in IMAGE_VARIANTS}
+
 class EnhancementService:
     def __init__(self):
         self.enhancer = None
         try:
-            self.enhancer = ImageEnhancer()
+            self.enhancer = create_enhancer_backend(upstream=upstream_resilience)
             print("Image enhancer initialized successfully")
         except Exception as e:
             print(f"Warning: Failed to initialize image enhancer: {e}")
+
+    @staticmethod
+    def select_tier(mode: str, has_credits: bool) -> str:
+        """
+        Tier that serves an enhancement: the local pipeline for the modes in
+        LOCAL_TIER_MODES, and for users without credits when the free-tier
+        fallback is on and the mode is available locally; otherwise the model.
+        """
+        if local_enhancer.supports(mode):
+            if mode in settings.LOCAL_TIER_MODES:
+                return TIER_LOCAL
+            if settings.LOCAL_TIER_FREE_FALLBACK and not has_credits:
+                return TIER_LOCAL
+        return TIER_MODEL
     
-    async def enhance_image(self, image_data: bytes, resolution: str = "standard", mode: str = "enhance", filter_type: str = None, custom_prompt: str = None) -> bytes:
-        logger.info(f"Enhancement service called - mode: {mode}, resolution: {resolution}")
+    async def enhance_image(self, image: Union[bytes, ImageContext], resolution: str = "standard", mode: str = "enhance", filter_type: str = None, custom_prompt: str = None, tier: str = TIER_MODEL) -> bytes:
+        logger.info(f"Enhancement service called - mode: {mode}, resolution: {resolution}, tier: {tier}")
 
-        if not self.enhancer:
+        if tier == TIER_LOCAL:
+            backend = local_enhancer
+        elif not self.enhancer:
             logger.error("Image enhancer not initialized")
             raise HTTPException(status_code=503, detail="Image enhancement service not available")
-
-        # Validate input image
-        try:
-            test_img = Image.open(io.BytesIO(image_data))
-            logger.debug(f"Input image validation successful - format: {test_img.format}, mode: {test_img.mode}, size: {test_img.size}")
-        except Exception as e:
-            logger.error(f"Input image validation failed: {e}")
-            raise HTTPException(status_code=400, detail=f"Invalid image data: {e}")
-
-        # Convert to PNG format
+        else:
+            backend = self.enhancer
+
+        # Validate input image (header only)
+        if isinstance(image, ImageContext):
+            source = image
+        else:
+            try:
+                source = ImageContext.probe(image)
+            except ValueError as e:
+                logger.error(f"Input image validation failed: {e}")
+                raise HTTPException(status_code=400, detail=str(e))
+
+        tiled_size = self.tiled_size(source, resolution) if tier == TIER_MODEL else None
+
+        # Decode straight into the downscaled model input, once, off the event loop
         try:
-            png_data = self.convert_to_png(image_data)
-            logger.debug(f"Converted to PNG - original size: {len(image_data)}, PNG size: {len(png_data)}")
+            with stage("normalize"):
+                model_input = await self.prepare_model_input(source, resolution, backend, tiled_size)
+            logger.debug(f"Prepared model input - original size: {source.size}, model size: {model_input.size}")
         except Exception as e:
-            logger.error(f"PNG conversion failed: {e}")
+            logger.error(f"Image decoding failed: {e}")
             raise HTTPException(status_code=400, detail=f"Image conversion failed: {e}")
 
-        # Enhance the image
+        if tier == TIER_LOCAL:
+            try:
+                with stage("model", tier=tier):
+                    enhanced_data = await backend.enhance(model_input, resolution, mode)
+                logger.info(f"Local enhancement completed - enhanced size: {len(enhanced_data)} bytes")
+                return enhanced_data
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.error(f"Local enhancement failed: {e}")
+                raise HTTPException(status_code=500, detail=f"Enhancement failed: {e}")
+
+        if tiled_size:
+            run = lambda: tiled_enhancer.enhance(backend, model_input, resolution, mode, filter_type, custom_prompt)
+        else:
+            run = lambda: backend.enhance(model_input, resolution, mode, filter_type, custom_prompt)
+
+        # Enhance the image, joining an identical in-flight call if there is one
+        flight_key = EnhancementResultCache.make_key(source.data, mode, resolution, filter_type, custom_prompt)
         try:
-            enhanced_data = await self.enhancer.enhance(png_data, resolution, mode, filter_type, custom_prompt)
+            with stage("model", tier=tier, tiled=bool(tiled_size)):
+                enhanced_data = await enhancement_flights.do(flight_key, run)
             logger.info(f"Image enhancement completed - enhanced size: {len(enhanced_data)} bytes")
             return enhanced_data
+        except UpstreamRejected as e:
+            logger.warning(f"Enhancement rejected upstream: {e}")
+            raise HTTPException(
+                status_code=503,
+                detail=str(e),
+                headers={"Retry-After": str(math.ceil(e.retry_after))}
+            )
         except Exception as e:
             logger.error(f"Enhancement failed: {e}")
             raise HTTPException(status_code=500, detail=f"Enhancement failed: {e}")
     
+    def tiled_size(self, source: ImageContext, resolution: str) -> Optional[tuple[int, int]]:
+        """Input size for tiled enhancement, or None when the source fits in a single model call"""
+        if not settings.TILED_ENABLED or resolution not in settings.TILED_RESOLUTIONS or not self.enhancer:
+            return None
+        call_size = self.enhancer.target_size(resolution)
+        if source.width <= call_size[0] and source.height <= call_size[1]:
+            return None
+        return (settings.TILED_MAX_SIZE, settings.TILED_MAX_SIZE)
+
+    async def prepare_model_input(self, source: ImageContext, resolution: str, backend=None, max_size: Optional[tuple[int, int]] = None) -> Image.Image:
+        """
+        Decode and downscale the source on the image process pool, to max_size
+        or else the input size of backend (the model by default)
+        """
+        max_size = max_size or (backend or self.enhancer).target_size(resolution)
+        if not source.has_scaled(max_size):
+            size, pixels = await image_pool.run(image_tasks.decode_scaled, source.worker_input(), max_size)
+            source.add_scaled(max_size, Image.frombytes('RGB', size, pixels))
+        return source.scaled(max_size)
+
     def convert_to_png(self, image_data: bytes) -> bytes:
         try:
             img = Image.open(io.BytesIO(image_data))
@@ -79,54 +195,43 @@ class EnhancementService:
 
         return thumb_io.getvalue()
 
-    def generate_multiple_sizes(self, image_data: bytes) -> dict[str, bytes]:
-        """Generate thumbnail, preview, and full size images"""
-        img = Image.open(io.BytesIO(image_data))
-        original_size = img.size
-
-        sizes = {}
-
-        # Thumbnail (200x200) - for lists
-        thumb_img = img.copy()
-        thumb_img.thumbnail((200, 200), Image.Resampling.LANCZOS)
-        thumb_io = io.BytesIO()
-        thumb_img.save(thumb_io, format='PNG')
-        thumb_io.seek(0)
-        sizes['thumbnail'] = thumb_io.getvalue()
-
-        # Preview (1080x1080) - for preview screens
-        preview_img = img.copy()
-        preview_img.thumbnail((1080, 1080), Image.Resampling.LANCZOS)
-        preview_io = io.BytesIO()
-        preview_img.save(preview_io, format='PNG')
-        preview_io.seek(0)
-        sizes['preview'] = preview_io.getvalue()
-
-        # Full (original size) - for final viewing/download
-        full_io = io.BytesIO()
-        img.save(full_io, format='PNG')
-        full_io.seek(0)
-        sizes['full'] = full_io.getvalue()
-
-        return sizes
-
-    def generate_blurhash(self, image_data: bytes, x_components: int = 4, y_components: int = 3) -> str:
+    async def render_variants(self, enhanced_data: bytes, skip: tuple[str, ...] = ()) -> tuple[dict[str, bytes], str]:
+        """
+        Variants (except those in skip) and blurhash of the model output. One
+        image pool task decodes the output once and scales the variants as a
+        cascade; the variants are then encoded in parallel, one task each.
+        """
+        names = tuple(variant.name for variant in IMAGE_VARIANTS if variant.name not in skip)
+        pixels, blurhash = await image_pool.run(image_tasks.scale_variants, enhanced_data, names)
+
+        encoded = await asyncio.gather(*(
+            image_pool.run(image_tasks.encode_variant, name, pixels.pop(name))
+            for name in names
+        ))
+        return dict(zip(names, encoded)), blurhash
+
+    @staticmethod
+    def stored_as_is(enhanced_data: bytes) -> dict[str, bytes]:
+        """The variants whose stored bytes are the model output itself, available before any encoding"""
+        enhanced = ImageContext.probe(enhanced_data)
+        return {
+            variant.name: enhanced.data
+            for variant in IMAGE_VARIANTS
+            if variant.max_size is None and enhanced.format == variant.format
+        }
+
+    @staticmethod
+    def generate_blurhash(image: Union[bytes, ImageContext], x_components: int = 4, y_components: int = 3) -> str:
         """Generate blurhash for an image"""
         try:
-            import blurhash
-            img = Image.open(io.BytesIO(image_data))
-
-            # Resize to small size for faster blurhash generation
-            img.thumbnail((100, 100), Image.Resampling.LANCZOS)
+            enhanced = image if isinstance(image, ImageContext) else ImageContext.probe(image)
 
-            # Convert to RGB if necessary
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
+            # Resize to small size for faster blurhash generation (RGB)
+            img = enhanced.scaled((100, 100))
 
             # Generate blurhash
-            hash_str = blurhash.encode(img, x_components=x_components, y_components=y_components)
-            return hash_str
+            return encode_blurhash(img, x_components=x_components, y_components=y_components)
         except Exception as e:
-            logger.error(f"Blurhash generation failed: {e}")
+            logger.error(f"Blurhash generation failed: {e}", exc_info=True)
             # Return a default gray blurhash on failure
-            return 'L6PZfSi_.AyE_3t7t7R**0o#DgR4'
\ No newline at end of file
+            return 'L6PZfSi_.AyE_3t7t7R**0o#DgR4'
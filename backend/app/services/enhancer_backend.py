@@ -0,0 +1,36 @@
+import sys
+from typing import Optional, Protocol, Union
+from PIL import Image
+
+# Import from backend root directory
+sys.path.append('/app')
+from image_enhancement import ImageEnhancer
+from fake_enhancer import FakeEnhancer
+from ..config.settings import settings
+
+
+class EnhancerBackend(Protocol):
+    """
+    What EnhancementService needs from an image model. Backends take an
+    optional upstream policy (see ImageEnhancer) and return encoded image bytes.
+    """
+
+    def target_size(self, resolution: str) -> tuple[int, int]:
+        ...
+
+    async def enhance(self, image_data: Union[bytes, Image.Image], resolution: str, mode: str = "enhance", filter_type: Optional[str] = None, custom_prompt: Optional[str] = None) -> bytes:
+        ...
+
+
+ENHANCER_BACKENDS = {
+    "gemini": ImageEnhancer,
+    "fake": FakeEnhancer,
+}
+
+
+def create_enhancer_backend(name: Optional[str] = None, upstream=None) -> EnhancerBackend:
+    """Instantiate the backend selected by ENHANCER_BACKEND (or name)"""
+    name = (name or settings.ENHANCER_BACKEND).lower()
+    if name not in ENHANCER_BACKENDS:
+        raise ValueError(f"Unknown enhancer backend '{name}', expected one of {', '.join(ENHANCER_BACKENDS)}")
+    return ENHANCER_BACKENDS[name](upstream=upstream)
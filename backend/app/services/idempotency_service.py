@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..config.settings import settings
+from ..models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStatus:
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+
+
+class IdempotencyService:
+    """
+    Idempotency-Key bookkeeping for the image endpoints.
+
+    The first request with a key claims it in the idempotency_keys table and
+    stores its response there when it finishes; replays within the TTL get
+    the stored response back instead of a second model call, credit charge
+    and history row. While the first request is still running, a replay
+    attaches to it: to its job for async requests, or to the running request
+    itself when it is handled by this worker process. Failed requests release
+    their key, so the client can retry them.
+    """
+
+    def __init__(self, ttl_seconds: int = 86400, lock_seconds: int = 900):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.lock = timedelta(seconds=lock_seconds)
+        self._running: Dict[str, asyncio.Task] = {}
+        self.claimed = 0
+        self.replayed = 0
+        self.attached = 0
+        self.conflicts = 0
+        self.released = 0
+
+    @staticmethod
+    def record_id(user_id: str, key: str) -> str:
+        return hashlib.sha256(f"{user_id}:{key}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def fingerprint(endpoint: str, **params) -> str:
+        """Hash of the request parameters, to refuse a key reused for a different request"""
+        values = "|".join(f"{name}={params[name] if params[name] is not None else ''}" for name in sorted(params))
+        return hashlib.sha256(f"{endpoint}|{values}".encode("utf-8")).hexdigest()
+
+    def claim(self, db: Session, user_id: str, key: str, endpoint: str, fingerprint: str) -> Tuple[IdempotencyKey, bool]:
+        """
+        Claim key for a new request. Returns the record and True when the
+        caller should process the request, or the existing record and False
+        when it is a replay.
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+
+        now = datetime.utcnow()
+        record_id = self.record_id(user_id, key)
+        self._prune(db, now)
+
+        record = db.get(IdempotencyKey, record_id)
+        if record is not None and self._is_stale(record, now):
+            logger.warning(f"Taking over stale idempotency key for user {user_id} (created {record.created_at})")
+            db.delete(record)
+            db.commit()
+            record = None
+
+        if record is None:
+            record = IdempotencyKey(
+                id=record_id,
+                user_id=user_id,
+                key=key,
+                endpoint=endpoint,
+                fingerprint=fingerprint,
+                status=IdempotencyStatus.PROCESSING,
+                created_at=now,
+                expires_at=now + self.ttl
+            )
+            db.add(record)
+            try:
+                db.commit()
+                self.claimed += 1
+                return record, True
+            except IntegrityError:
+                # A concurrent request with the same key claimed it first
+                db.rollback()
+                record = db.get(IdempotencyKey, record_id)
+                if record is None:
+                    raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+
+        if record.fingerprint != fingerprint:
+            self.conflicts += 1
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        return record, False
+
+    def attach_job(self, db: Session, record_id: str, job_id: str):
+        record = db.get(IdempotencyKey, record_id)
+        if record is not None:
+            record.job_id = job_id
+            db.commit()
+
+    def complete(self, db: Session, record_id: str, status_code: int, response: Dict[str, Any]):
+        """Store the response that replays of the key receive"""
+        record = db.get(IdempotencyKey, record_id)
+        if record is None:
+            return
+        record.status = IdempotencyStatus.COMPLETED
+        record.status_code = status_code
+        record.response = response
+        record.expires_at = datetime.utcnow() + self.ttl
+        db.commit()
+
+    def release(self, db: Session, record_id: str):
+        """Drop the key of a failed request, so a retry processes it again"""
+        try:
+            db.rollback()
+            if db.query(IdempotencyKey).filter(IdempotencyKey.id == record_id).delete():
+                self.released += 1
+            db.commit()
+        except Exception as e:
+            logger.error(f"Failed to release idempotency key {record_id[:16]}: {e}")
+            db.rollback()
+
+    async def run(self, record_id: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run the request for a claimed key so replays in this process can attach to it"""
+        task = asyncio.ensure_future(fn())
+        self._running[record_id] = task
+        task.add_done_callback(lambda _: self._running.pop(record_id, None))
+        return await asyncio.shield(task)
+
+    def running(self, record_id: str) -> Optional[asyncio.Task]:
+        return self._running.get(record_id)
+
+    def _is_stale(self, record: IdempotencyKey, now: datetime) -> bool:
+        if record.expires_at <= now:
+            return True
+        # An unfinished request past the lock time is assumed lost (worker restart)
+        return (
+            record.status == IdempotencyStatus.PROCESSING
+            and record.id not in self._running
+            and record.created_at + self.lock <= now
+        )
+
+    def _prune(self, db: Session, now: datetime):
+        expired = db.query(IdempotencyKey).filter(IdempotencyKey.expires_at <= now).delete()
+        # Commit even when nothing was deleted; a replay must not hold the transaction while it waits
+        db.commit()
+        if expired:
+            logger.info(f"Pruned {expired} expired idempotency keys")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "running": len(self._running),
+            "claimed": self.claimed,
+            "replayed": self.replayed,
+            "attached": self.attached,
+            "conflicts": self.conflicts,
+            "released": self.released,
+        }
+
+
+idempotency_service = IdempotencyService(
+    ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+    lock_seconds=settings.IDEMPOTENCY_LOCK_SECONDS
+)
@@ -0,0 +1,204 @@
+import io
+import os
+import mmap
+import hashlib
+import logging
+import weakref
+from typing import BinaryIO, Dict, Optional, Tuple, Union
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {
+    "PNG": "png",
+    "JPEG": "jpg",
+    "WEBP": "webp",
+    "GIF": "gif",
+    "BMP": "bmp",
+    "TIFF": "tiff",
+    "MPO": "jpg",
+}
+
+# Formats whose decoder can scale while decoding (libjpeg DCT scaling)
+DRAFT_FORMATS = ("JPEG", "MPO")
+
+FORMAT_CONTENT_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+    "BMP": "image/bmp",
+    "TIFF": "image/tiff",
+    "MPO": "image/jpeg",
+}
+
+
+class ImageContext:
+    """
+    Encoded image bytes plus the decoded views derived from them.
+
+    A context is created once per image with a header-only probe and then
+    passed through the pipeline stages, so each stage reuses the same decode
+    (and the same downscaled copy) instead of opening the bytes again.
+
+    Large uploads are spooled to a file instead of being held in memory; the
+    context then maps the file and data is a read-only mmap (see from_file).
+    """
+
+    def __init__(self, data: Union[bytes, mmap.mmap], format: str, size: Tuple[int, int], mode: str, path: Optional[str] = None):
+        self.data = data
+        self.format = format
+        self.size = size
+        self.mode = mode
+        self.path = path
+        self._sha256: Optional[str] = None
+        self._decoded: Optional[Image.Image] = None
+        self._scaled: Dict[Tuple[int, int], Image.Image] = {}
+        self._file: Optional[BinaryIO] = None
+        self._finalizer: Optional[weakref.finalize] = None
+
+    @classmethod
+    def probe(cls, data: bytes) -> "ImageContext":
+        """Read only the image header; raises ValueError if it is not an image"""
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                ctx = cls(data, img.format, img.size, img.mode)
+        except Exception as e:
+            raise ValueError(f"Invalid image data: {e}")
+
+        logger.debug(f"Probed image - format: {ctx.format}, mode: {ctx.mode}, size: {ctx.size}, bytes: {len(data)}")
+        return ctx
+
+    @classmethod
+    def from_file(cls, path: str, delete: bool = False) -> "ImageContext":
+        """
+        Header probe of an image file, which is mapped rather than read. With
+        delete the file is removed when the context is closed or collected.
+        """
+        file = open(path, "rb")
+        data = None
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            with Image.open(path) as img:
+                ctx = cls(data, img.format, img.size, img.mode, path=path)
+        except Exception as e:
+            _close_file(file, data, path if delete else None)
+            raise ValueError(f"Invalid image data: {e}")
+
+        ctx._file = file
+        ctx._finalizer = weakref.finalize(ctx, _close_file, file, data, path if delete else None)
+        logger.debug(f"Probed image file - format: {ctx.format}, mode: {ctx.mode}, size: {ctx.size}, bytes: {len(data)}")
+        return ctx
+
+    @classmethod
+    def load(cls, source: Union[bytes, str]) -> "ImageContext":
+        """Counterpart of worker_input(), used inside worker processes"""
+        return cls.from_file(source) if isinstance(source, str) else cls.probe(source)
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    @property
+    def extension(self) -> str:
+        return FORMAT_EXTENSIONS.get(self.format, "png")
+
+    @property
+    def content_type(self) -> str:
+        return FORMAT_CONTENT_TYPES.get(self.format, "image/png")
+
+    @property
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.data).hexdigest()
+        return self._sha256
+
+    def open(self) -> BinaryIO:
+        """Independent file object over the encoded bytes, without copying them"""
+        if self._file is not None:
+            # A separate mapping of the same pages, so each reader has its own position
+            return mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return io.BytesIO(self.data)
+
+    def worker_input(self) -> Union[bytes, str]:
+        """The bytes, or for spooled images the file path, to hand to a worker process"""
+        return self.path if self.path is not None else self.data
+
+    def decode(self) -> Image.Image:
+        """Full resolution decode, performed at most once"""
+        if self._decoded is None:
+            img = Image.open(self.open())
+            img.load()
+            self._decoded = img
+        return self._decoded
+
+    def scaled(self, max_size: Tuple[int, int]) -> Image.Image:
+        """
+        RGB copy that fits within max_size. It is derived from the smallest
+        view already decoded that covers max_size; when nothing has been
+        decoded yet, the bytes are decoded straight into the downscaled copy.
+        JPEGs are decoded at the smallest 1/2, 1/4 or 1/8 DCT scale that still
+        covers max_size, so a 48MP photo never exists at full size in memory.
+        """
+        if max_size in self._scaled:
+            return self._scaled[max_size]
+
+        source = self._covering_view(max_size)
+        reducing_gap = 2.0
+        if source is not None:
+            img = source.copy()
+        else:
+            img = Image.open(self.open())
+            if img.format in DRAFT_FORMATS:
+                # thumbnail() drafts to reducing_gap times the target size
+                reducing_gap = 1.0
+
+        img.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        self._scaled[max_size] = img
+        return img
+
+    def has_scaled(self, max_size: Tuple[int, int]) -> bool:
+        return max_size in self._scaled
+
+    def add_scaled(self, max_size: Tuple[int, int], img: Image.Image):
+        """Register a downscaled RGB view produced elsewhere so later stages can reuse it"""
+        if img.mode == 'RGB':
+            self._scaled[max_size] = img
+
+    def _covering_view(self, max_size: Tuple[int, int]) -> Optional[Image.Image]:
+        views = [
+            view for view in self._scaled.values()
+            if view.width >= min(max_size[0], self.width) and view.height >= min(max_size[1], self.height)
+        ]
+        if views:
+            return min(views, key=lambda view: view.width * view.height)
+        return self._decoded
+
+    def release(self):
+        """Drop decoded pixel data once no later stage needs it"""
+        self._decoded = None
+        self._scaled.clear()
+
+    def close(self):
+        """Release decoded data and unmap (and, if owned, delete) a spool file"""
+        self.release()
+        if self._finalizer is not None:
+            self._finalizer()
+
+
+def _close_file(file: BinaryIO, data: Optional[mmap.mmap], delete_path: Optional[str]):
+    if data is not None:
+        data.close()
+    file.close()
+    if delete_path:
+        try:
+            os.unlink(delete_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,126 @@
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+from fastapi import HTTPException
+from ..config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ImageProcessPool:
+    """
+    Process pool for CPU-bound Pillow work (decoding, resizing, encoding),
+    keeping it off the event loop and out of the GIL of the serving process.
+
+    Workers are forked when the pool starts, before the app spins up other
+    threads. Until start() is called (scripts, or IMAGE_POOL_WORKERS=0) tasks
+    run on a thread instead. At most workers + max_queue tasks may be
+    outstanding; beyond that requests are rejected with 503.
+
+    When a worker dies the pool is replaced once, on a thread, using
+    forkserver (or spawn): by then the serving process runs threads, and
+    forking it could copy held locks into the new workers.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._restart_lock = threading.Lock()
+        self.restarts = 0
+        self.outstanding = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_task_ms = 0.0
+        self.max_task_ms = 0.0
+
+    def start(self, start_method: str = "fork"):
+        if self.workers <= 0:
+            logger.info("Image process pool disabled, image work runs on threads")
+            return
+
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(start_method)
+        )
+        from .image_tasks import warm_up
+        pids = {future.result() for future in [executor.submit(warm_up) for _ in range(self.workers)]}
+        self._executor = executor
+        logger.info(f"Image process pool started with {self.workers} {start_method} workers (pids: {sorted(pids)}), max queue {self.max_queue}")
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        """Replace a broken executor; concurrent failures of the same executor restart it once"""
+        with self._restart_lock:
+            if self._executor is not broken:
+                # Already replaced by another failed task, or the pool was shut down
+                return
+            self.shutdown()
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self.start(start_method)
+            self.restarts += 1
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Image process pool stopped")
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        limit = max(1, self.workers) + self.max_queue
+        if self.outstanding >= limit:
+            self.rejected += 1
+            logger.warning(f"Image process pool saturated ({self.outstanding} outstanding), rejecting {fn.__name__}")
+            raise HTTPException(status_code=503, detail="Server busy processing images, please retry shortly")
+
+        self.outstanding += 1
+        start = time.perf_counter()
+        executor = self._executor
+        try:
+            if executor is None:
+                result = await asyncio.to_thread(fn, *args)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            self.completed += 1
+            return result
+        except BrokenProcessPool:
+            self.failed += 1
+            logger.error("Image process pool broke (worker died), restarting it")
+            # Starting workers waits for them; keep that off the event loop
+            await asyncio.to_thread(self._restart, executor)
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.outstanding -= 1
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.total_task_ms += elapsed_ms
+            self.max_task_ms = max(self.max_task_ms, elapsed_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed
+        return {
+            "mode": "process" if self._executor else "thread",
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "running": min(self.outstanding, max(1, self.workers)),
+            "queued": max(0, self.outstanding - max(1, self.workers)),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "avg_task_ms": round(self.total_task_ms / finished, 1) if finished else 0.0,
+            "max_task_ms": round(self.max_task_ms, 1),
+        }
+
+
+image_pool = ImageProcessPool(
+    workers=settings.IMAGE_POOL_WORKERS,
+    max_queue=settings.IMAGE_POOL_MAX_QUEUE
+)
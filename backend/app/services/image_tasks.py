@@ -0,0 +1,85 @@
+"""
+CPU-bound image transforms run on the image process pool.
+
+Functions here are executed in worker processes, so they take and return
+only picklable values (bytes, tuples, dicts, spool file paths) rather than
+PIL images or ImageContext objects.
+"""
+import io
+from typing import Dict, Tuple, Union
+from PIL import Image
+from .image_context import ImageContext
+
+# Raw pixels of a decoded image as (mode, size, bytes), for Image.frombytes
+Pixels = Tuple[str, Tuple[int, int], bytes]
+
+
+def decode_scaled(source: Union[bytes, str], max_size: Tuple[int, int]) -> Tuple[Tuple[int, int], bytes]:
+    """Decode encoded image bytes, or a spooled upload, straight to an RGB image fitting max_size"""
+    ctx = ImageContext.load(source)
+    try:
+        img = ctx.scaled(max_size)
+        return img.size, img.tobytes()
+    finally:
+        ctx.close()
+
+
+def scale_variants(data: bytes, names: Tuple[str, ...]) -> Tuple[Dict[str, Pixels], str]:
+    """
+    Decode an enhanced image once and build the named variants as a resize
+    cascade, each from the previous, larger one (full -> preview -> thumbnail,
+    with reduce()/draft for the big steps), then the blurhash from the
+    smallest. Returns raw pixels for encode_variant, so the variants encode
+    in parallel without decoding or resizing again.
+    """
+    from .enhancement_service import EnhancementService, IMAGE_VARIANTS
+
+    enhanced = ImageContext.probe(data)
+    try:
+        pixels = {}
+        # Largest first, so each view is scaled from the one before it
+        for variant in IMAGE_VARIANTS:
+            if variant.name not in names:
+                continue
+            if variant.max_size is None:
+                img = enhanced.decode()
+                if img.mode == 'P':
+                    # frombytes() cannot carry the palette over
+                    img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+            else:
+                img = enhanced.scaled(variant.max_size)
+            pixels[variant.name] = (img.mode, img.size, img.tobytes())
+        return pixels, EnhancementService.generate_blurhash(enhanced)
+    finally:
+        enhanced.release()
+
+
+def encode_variant(name: str, pixels: Pixels) -> bytes:
+    """Encode one variant from the raw pixels scale_variants produced"""
+    from .enhancement_service import VARIANTS_BY_NAME
+
+    mode, size, raw = pixels
+    return VARIANTS_BY_NAME[name].encode(Image.frombytes(mode, size, raw))
+
+
+def render_variants(data: bytes, skip: Tuple[str, ...] = ()) -> Tuple[dict, str]:
+    """Encode the stored variants of an enhanced image, except those in skip, one after another (scripts)"""
+    from .enhancement_service import IMAGE_VARIANTS
+
+    names = tuple(variant.name for variant in IMAGE_VARIANTS if variant.name not in skip)
+    pixels, blurhash = scale_variants(data, names)
+    return {name: encode_variant(name, pixels[name]) for name in names}, blurhash
+
+
+def thumbnail(data: bytes, max_size: Tuple[int, int] = (200, 200)) -> bytes:
+    """PNG thumbnail of encoded image bytes"""
+    img = ImageContext.probe(data).scaled(max_size)
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def warm_up() -> int:
+    """No-op used to start worker processes ahead of the first request"""
+    import os
+    return os.getpid()
@@ -0,0 +1,172 @@
+import asyncio
+import uuid
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+from fastapi import HTTPException
+from ..models import SessionLocal
+from .progress import Progress, current_progress
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    user_id: str
+    handler: Optional[Callable[[Any], Awaitable[Any]]]
+    status: str = JobStatus.PENDING
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Any = None
+    error: Optional[str] = None
+    error_status: Optional[int] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    progress: Progress = field(default_factory=Progress)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED)
+
+
+class JobService:
+    """
+    In-process job queue for long running image requests.
+
+    Jobs are held in memory and processed by a fixed number of worker tasks,
+    so they do not survive a restart and are only visible to the worker
+    process that accepted them.
+    """
+
+    def __init__(self, workers: int = 4, max_queue_size: int = 100, result_ttl_seconds: int = 3600):
+        self.worker_count = max(1, workers)
+        self.max_queue_size = max_queue_size
+        self.result_ttl = timedelta(seconds=result_ttl_seconds)
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"job-worker-{i}")
+            for i in range(self.worker_count)
+        ]
+        logger.info(f"Job service started with {self.worker_count} workers (queue size {self.max_queue_size})")
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Job service stopped")
+
+    def submit(self, kind: str, user_id: str, handler: Callable[[Any], Awaitable[Any]]) -> Job:
+        """
+        Queue a job. The handler is called with a fresh database session and
+        must return the response model for the request.
+        """
+        if self._queue is None:
+            raise HTTPException(status_code=503, detail="Job service not available")
+
+        self._prune()
+
+        job = Job(id=str(uuid.uuid4()), kind=kind, user_id=user_id, handler=handler)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            logger.warning(f"Job queue full, rejecting {kind} job for user {user_id}")
+            raise HTTPException(status_code=503, detail="Too many pending jobs, please retry later")
+
+        self.jobs[job.id] = job
+        job.progress.emit("status", status=job.status, queue_depth=self._queue.qsize())
+        logger.info(f"Queued {kind} job {job.id} for user {user_id} (queue depth: {self._queue.qsize()})")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._prune()
+        return self.jobs.get(job_id)
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """Wait up to timeout seconds for the job to finish"""
+        if timeout > 0 and not job.is_finished:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        counts = {status: 0 for status in (JobStatus.PENDING, JobStatus.RUNNING, JobStatus.COMPLETED, JobStatus.FAILED)}
+        for job in self.jobs.values():
+            counts[job.status] += 1
+        return {
+            "workers": self.worker_count,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            **counts,
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        job.status = JobStatus.RUNNING
+        job.started_at = datetime.utcnow()
+        logger.info(f"Running {job.kind} job {job.id}")
+        job.progress.emit("status", status=job.status)
+
+        db = SessionLocal()
+        # Pipeline stages report to this job's progress while the handler runs
+        token = current_progress.set(job.progress)
+        try:
+            job.result = await job.handler(db)
+            job.status = JobStatus.COMPLETED
+        except HTTPException as e:
+            job.status = JobStatus.FAILED
+            job.error = str(e.detail)
+            job.error_status = e.status_code
+        except Exception as e:
+            logger.error(f"{job.kind} job {job.id} failed: {e}", exc_info=True)
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+            job.error_status = 500
+        finally:
+            current_progress.reset(token)
+            db.close()
+            job.handler = None
+            job.finished_at = datetime.utcnow()
+            job.done.set()
+
+        if job.status == JobStatus.COMPLETED:
+            result = job.result.model_dump() if hasattr(job.result, "model_dump") else job.result
+            job.progress.close(JobStatus.COMPLETED, result=result)
+        else:
+            job.progress.close(JobStatus.FAILED, error=job.error, error_status=job.error_status)
+
+        duration = (job.finished_at - job.started_at).total_seconds()
+        logger.info(f"{job.kind} job {job.id} {job.status} in {duration:.2f}s")
+
+    def _prune(self):
+        cutoff = datetime.utcnow() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.is_finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
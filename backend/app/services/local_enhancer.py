@@ -0,0 +1,179 @@
+"""
+Local processing tier: a NumPy tone pipeline for the modes that are mostly
+exposure and contrast work, answered in milliseconds without a model call.
+
+The luma channel is stretched to its percentile range, equalized with
+contrast-limited adaptive histogram equalization (CLAHE), gamma corrected
+towards a mid-grey mean and unsharp masked; chroma is left untouched.
+"""
+import io
+import sys
+import logging
+from dataclasses import dataclass
+from typing import Optional, Union
+import numpy as np
+from PIL import Image
+
+# Import from backend root directory
+sys.path.append('/app')
+from image_enhancement import ImageEnhancer
+from .image_process_pool import image_pool
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ToneProfile:
+    """Pipeline parameters for one mode"""
+    clip_limit: float        # CLAHE histogram clip, in multiples of the mean bin
+    tiles: int = 8           # CLAHE grid (tiles per side)
+    blend: float = 1.0       # share of the equalized luma in the result
+    target_mean: Optional[float] = None  # gamma towards this mean luma (0-1), None keeps it
+    sharpen: float = 0.0     # unsharp mask amount
+    sharpen_radius: float = 1.5
+
+
+LOCAL_PROFILES = {
+    "enhance": ToneProfile(clip_limit=1.5, blend=0.6, sharpen=0.6),
+    "enlighten": ToneProfile(clip_limit=2.5, blend=0.8, target_mean=0.5, sharpen=0.3),
+}
+
+
+def stretch_contrast(luma: np.ndarray, low: float = 0.5, high: float = 99.5) -> np.ndarray:
+    """Map the low..high percentile range of luma (0-1 floats) onto 0-1"""
+    lo, hi = np.percentile(luma, (low, high))
+    if hi - lo < 1e-3:
+        return luma
+    return np.clip((luma - lo) / (hi - lo), 0.0, 1.0)
+
+
+def equalize_clahe(luma: np.ndarray, tiles: int = 8, clip_limit: float = 2.0) -> np.ndarray:
+    """
+    CLAHE on 0-1 luma. Each tile gets a clipped histogram equalization LUT;
+    pixels are mapped through the four nearest tile LUTs, bilinearly
+    weighted by distance to the tile centres, so tile borders do not show.
+    """
+    height, width = luma.shape
+    tiles_y, tiles_x = min(tiles, height), min(tiles, width)
+    levels = np.rint(luma * 255).astype(np.intp)
+
+    # Histogram of every tile in one bincount
+    tile_y = np.arange(height) * tiles_y // height
+    tile_x = np.arange(width) * tiles_x // width
+    tile_index = tile_y[:, None] * tiles_x + tile_x[None, :]
+    hist = np.bincount((tile_index * 256 + levels).ravel(), minlength=tiles_y * tiles_x * 256)
+    hist = hist.reshape(tiles_y, tiles_x, 256).astype(np.float64)
+
+    # Clip each histogram and spread the excess evenly over all bins
+    tile_pixels = hist.sum(axis=2, keepdims=True)
+    limit = np.maximum(1.0, clip_limit * tile_pixels / 256)
+    excess = np.maximum(hist - limit, 0).sum(axis=2, keepdims=True)
+    hist = np.minimum(hist, limit) + excess / 256
+    luts = (np.cumsum(hist, axis=2) / tile_pixels).astype(np.float32)
+
+    def neighbours(size: int, count: int):
+        position = (np.arange(size) + 0.5) * count / size - 0.5
+        low = np.clip(np.floor(position).astype(np.intp), 0, count - 1)
+        high = np.minimum(low + 1, count - 1)
+        weight = np.clip(position - low, 0.0, 1.0).astype(np.float32)
+        return low, high, weight
+
+    y0, y1, wy = neighbours(height, tiles_y)
+    x0, x1, wx = neighbours(width, tiles_x)
+    wy, wx = wy[:, None], wx[None, :]
+    top = luts[y0[:, None], x0[None, :], levels] * (1 - wx) + luts[y0[:, None], x1[None, :], levels] * wx
+    bottom = luts[y1[:, None], x0[None, :], levels] * (1 - wx) + luts[y1[:, None], x1[None, :], levels] * wx
+    return top * (1 - wy) + bottom * wy
+
+
+def correct_gamma(luma: np.ndarray, target_mean: float = 0.5, limits: tuple = (0.5, 2.0)) -> np.ndarray:
+    """Gamma that moves the mean luma towards target_mean, within limits"""
+    mean = float(luma.mean())
+    if mean <= 0.01 or mean >= 0.99:
+        return luma
+    gamma = float(np.clip(np.log(target_mean) / np.log(mean), *limits))
+    return np.power(luma, gamma)
+
+
+def gaussian_blur(values: np.ndarray, sigma: float) -> np.ndarray:
+    """Separable Gaussian blur of a 2D array, edges reflected"""
+    reach = max(1, int(np.ceil(3 * sigma)))
+    kernel = np.exp(-0.5 * (np.arange(-reach, reach + 1) / sigma) ** 2).astype(np.float32)
+    kernel /= kernel.sum()
+    for axis in (0, 1):
+        padding = [(0, 0), (0, 0)]
+        padding[axis] = (reach, reach)
+        padded = np.pad(values, padding, mode="reflect")
+        length = values.shape[axis]
+        blurred = np.zeros_like(values)
+        for offset, weight in enumerate(kernel):
+            blurred += weight * (padded[offset:offset + length] if axis == 0 else padded[:, offset:offset + length])
+        values = blurred
+    return values
+
+
+def unsharp_mask(luma: np.ndarray, radius: float, amount: float) -> np.ndarray:
+    """luma + amount * (luma - gaussian blur of luma)"""
+    return np.clip(luma + amount * (luma - gaussian_blur(luma, radius)), 0.0, 1.0)
+
+
+def enhance_image(img: Image.Image, mode: str) -> Image.Image:
+    """Run the tone pipeline of mode on an image, returning an RGB image"""
+    profile = LOCAL_PROFILES[mode]
+    ycbcr = img.convert("RGB").convert("YCbCr")
+    y, cb, cr = ycbcr.split()
+
+    luma = np.asarray(y, dtype=np.float32) / 255
+    luma = stretch_contrast(luma)
+    equalized = equalize_clahe(luma, profile.tiles, profile.clip_limit)
+    luma = profile.blend * equalized + (1 - profile.blend) * luma
+    if profile.target_mean is not None:
+        luma = correct_gamma(luma, profile.target_mean)
+    if profile.sharpen:
+        luma = unsharp_mask(luma, profile.sharpen_radius, profile.sharpen)
+
+    y = Image.fromarray(np.rint(luma * 255).astype(np.uint8), "L")
+    return Image.merge("YCbCr", (y, cb, cr)).convert("RGB")
+
+
+def enhance_pixels(size: tuple[int, int], pixels: bytes, mode: str) -> bytes:
+    """Process-pool entry point: raw RGB pixels in, PNG bytes out"""
+    img = enhance_image(Image.frombytes("RGB", size, pixels), mode)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class LocalEnhancer:
+    """
+    Enhancer with the same interface as ImageEnhancer for the modes in
+    LOCAL_PROFILES. Work runs on the image process pool.
+    """
+
+    MODES = tuple(LOCAL_PROFILES)
+
+    @staticmethod
+    def supports(mode: str) -> bool:
+        return mode in LOCAL_PROFILES
+
+    @staticmethod
+    def target_size(resolution: str) -> tuple[int, int]:
+        return ImageEnhancer.target_size(resolution)
+
+    async def enhance(self, image_data: Union[bytes, Image.Image], resolution: str, mode: str = "enhance", filter_type: Optional[str] = None, custom_prompt: Optional[str] = None) -> bytes:
+        if not self.supports(mode):
+            raise ValueError(f"Mode '{mode}' is not available in the local tier")
+
+        img = image_data if isinstance(image_data, Image.Image) else Image.open(io.BytesIO(image_data))
+        target_size = self.target_size(resolution)
+        if img.width > target_size[0] or img.height > target_size[1]:
+            img = img.copy()
+            img.thumbnail(target_size, Image.Resampling.LANCZOS)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+
+        logger.info(f"Local enhancement - Mode: {mode}, Resolution: {resolution}, Size: {img.size}")
+        return await image_pool.run(enhance_pixels, img.size, img.tobytes(), mode)
+
+
+local_enhancer = LocalEnhancer()
@@ -0,0 +1,93 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+from ..config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PresignedUrl:
+    url: str
+    signed_at: float
+    expires_in: int
+
+
+class PresignedUrlCache:
+    """
+    In-memory LRU cache of presigned GET URLs keyed by object key and expiry.
+    A URL is handed out again until reuse_fraction of its lifetime has passed,
+    so repeated history fetches return the same URL and client and CDN caches
+    keyed by URL can hit, while every URL handed out stays valid for at least
+    the remaining share of its lifetime.
+    """
+
+    def __init__(self, max_entries: int = 10000, reuse_fraction: float = 0.75, enabled: bool = True):
+        self.max_entries = max_entries
+        self.reuse_fraction = reuse_fraction
+        self.enabled = enabled
+        self._entries: "OrderedDict[tuple[str, int], PresignedUrl]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, expires_in: int) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get((key, expires_in))
+            # Wall-clock time, as the URL's expiry is checked against the signing time by MinIO
+            if entry and time.time() - entry.signed_at >= entry.expires_in * self.reuse_fraction:
+                del self._entries[(key, expires_in)]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end((key, expires_in))
+            self.hits += 1
+            return entry.url
+
+    def put(self, key: str, expires_in: int, url: str) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries[(key, expires_in)] = PresignedUrl(url=url, signed_at=time.time(), expires_in=expires_in)
+            self._entries.move_to_end((key, expires_in))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        """Forget the URLs of a removed object"""
+        with self._lock:
+            for cached in [cached for cached in self._entries if cached[0] == key]:
+                del self._entries[cached]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "reuse_fraction": self.reuse_fraction,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+presigned_url_cache = PresignedUrlCache(
+    max_entries=settings.PRESIGNED_URL_CACHE_MAX_ENTRIES,
+    reuse_fraction=settings.PRESIGNED_URL_REUSE_FRACTION,
+    enabled=settings.PRESIGNED_URL_CACHE_ENABLED
+)
@@ -0,0 +1,117 @@
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+
+class Progress:
+    """
+    Ordered log of progress events for one job. Events may be emitted from
+    the event loop or from worker threads; any number of readers (the job's
+    SSE streams) replay the log and then follow it until it is closed.
+    """
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.stage: Optional[str] = None
+        self.closed = False
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self._changed: Optional[asyncio.Event] = None
+        try:
+            self._loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+
+    def emit(self, event: str, **data):
+        self._append(event, data, final=False)
+
+    def close(self, event: str, **data):
+        """Emit the final event; readers stop after it"""
+        self._append(event, data, final=True)
+
+    def _append(self, event: str, data: Dict[str, Any], final: bool):
+        with self._lock:
+            if self.closed:
+                return
+            if event == "stage":
+                self.stage = data.get("stage") if data.get("status") == "started" else None
+            data["elapsed_ms"] = round((time.monotonic() - self._started) * 1000, 1)
+            self.events.append({"id": len(self.events), "event": event, "data": data})
+            if final:
+                self.closed = True
+                self.stage = None
+        self._notify()
+
+    async def follow(self, after: int = -1, keepalive: float = 15.0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield the events with an id above after as they arrive, ending after
+        the final event. Yields None when nothing happened for keepalive seconds.
+        """
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        position = after + 1
+        while True:
+            # Take the wake-up event before reading, so nothing emitted after the read is missed
+            if self._changed is None:
+                self._changed = asyncio.Event()
+            changed = self._changed
+            with self._lock:
+                pending = self.events[position:]
+                closed = self.closed
+            for event in pending:
+                yield event
+            position += len(pending)
+            if closed:
+                return
+            if not pending:
+                try:
+                    await asyncio.wait_for(changed.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+
+    def _notify(self):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not None and running is self._loop:
+            self._wake()
+        elif self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+
+# Progress of the job the current task is running, if any (set by JobService)
+current_progress: ContextVar[Optional[Progress]] = ContextVar("current_progress", default=None)
+
+
+def report(event: str, **data):
+    """Emit an event to the current job's progress; no-op outside jobs"""
+    progress = current_progress.get()
+    if progress is not None:
+        progress.emit(event, **data)
+
+
+@contextmanager
+def stage(name: str, **data) -> Iterator[None]:
+    """Report the start, and completion or failure, of a processing stage with its duration"""
+    progress = current_progress.get()
+    if progress is None:
+        yield
+        return
+
+    start = time.monotonic()
+    progress.emit("stage", stage=name, status="started", **data)
+    try:
+        yield
+    except BaseException:
+        progress.emit("stage", stage=name, status="failed", duration_ms=round((time.monotonic() - start) * 1000, 1), **data)
+        raise
+    progress.emit("stage", stage=name, status="completed", duration_ms=round((time.monotonic() - start) * 1000, 1), **data)
@@ -0,0 +1,107 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+from ..config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedResult:
+    """Storage keys produced by a completed enhancement"""
+    image_keys: Dict[str, str]
+    blurhash: Optional[str] = None
+    enhanced_size: int = 0
+    stored_at: float = field(default_factory=time.monotonic)
+
+
+class EnhancementResultCache:
+    """
+    In-memory LRU cache of enhancement results keyed by the input content and
+    the parameters that influence the model output. Entries only hold object
+    keys, so a hit reuses the images already in storage.
+
+    Keys include the user id: a hit hands out the stored objects of an
+    earlier result, and those must belong to the requesting user. The input
+    is hashed as uploaded, not after normalization (decode, EXIF transpose,
+    downscale), so that a key costs no decode; a re-encode of the same image
+    (other quality, stripped metadata) is a miss.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: int = 86400, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(image_data: bytes, mode: str, resolution: str, filter_type: Optional[str] = None, custom_prompt: Optional[str] = None, tier: str = "model", user_id: Optional[str] = None) -> str:
+        """
+        Cache key of an input and its parameters. Without user_id the key is
+        shared by all users, which only suits deduplicating model calls
+        (single flight), never reusing stored results.
+        """
+        digest = hashlib.sha256(image_data).hexdigest()
+        params = "|".join([mode or "", filter_type or "", (custom_prompt or "").strip(), resolution or "", tier, user_id or ""])
+        return f"{digest}:{hashlib.sha256(params.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry.stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        logger.info(f"Result cache hit for {key[:16]}...")
+        return entry
+
+    def put(self, key: str, result: CachedResult) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+result_cache = EnhancementResultCache(
+    max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS,
+    enabled=settings.RESULT_CACHE_ENABLED
+)
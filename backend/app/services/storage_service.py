@@ -1,23 +1,176 @@
 import io
+import os
+import time
+import asyncio
 import uuid
+import random
+import hashlib
 import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from PIL import Image
+from typing import Callable, Deque, Dict, Iterator, Optional, Union
+import certifi
+import urllib3
 from minio import Minio
 from minio.error import S3Error
 from ..config.settings import settings
+from .image_context import ImageContext
+from .presigned_url_cache import presigned_url_cache
 
 logger = logging.getLogger(__name__)
 
+
+class UploadStats:
+    """Object upload latency and verification counters, shared by all StorageService instances"""
+
+    def __init__(self):
+        self.uploads = 0
+        self.bytes = 0
+        self.etag_verified = 0
+        self.deep_verified = 0
+        self.failed = 0
+        self.aborted = 0
+        self.removed = 0
+        self._put_latencies: Deque[float] = deque(maxlen=1000)
+        self._deep_latencies: Deque[float] = deque(maxlen=1000)
+
+    def record(self, size: int, put_seconds: float, etag_verified: bool, deep_seconds: Optional[float]):
+        self.uploads += 1
+        self.bytes += size
+        self._put_latencies.append(put_seconds)
+        if etag_verified:
+            self.etag_verified += 1
+        if deep_seconds is not None:
+            self.deep_verified += 1
+            self._deep_latencies.append(deep_seconds)
+
+    @staticmethod
+    def _percentile_ms(latencies: Deque[float], fraction: float) -> float:
+        if not latencies:
+            return 0.0
+        ordered = sorted(latencies)
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 1)
+
+    def stats(self) -> Dict[str, object]:
+        puts, deep = self._put_latencies, self._deep_latencies
+        return {
+            "uploads": self.uploads,
+            "bytes": self.bytes,
+            "etag_verified": self.etag_verified,
+            "deep_verified": self.deep_verified,
+            "failed": self.failed,
+            "aborted_results": self.aborted,
+            "removed_objects": self.removed,
+            "deep_verify_rate": settings.STORAGE_DEEP_VERIFY_RATE,
+            "upload_ms_avg": round(sum(puts) / len(puts) * 1000, 1) if puts else 0.0,
+            "upload_ms_p50": self._percentile_ms(puts, 0.5),
+            "upload_ms_p95": self._percentile_ms(puts, 0.95),
+            "deep_verify_ms_avg": round(sum(deep) / len(deep) * 1000, 1) if deep else 0.0,
+            "deep_verify_ms_p95": self._percentile_ms(deep, 0.95),
+        }
+
+
+upload_stats = UploadStats()
+
+# Shared by all requests, so concurrent requests cannot open unbounded connections to MinIO
+upload_executor = ThreadPoolExecutor(max_workers=settings.STORAGE_UPLOAD_THREADS, thread_name_prefix="storage-upload")
+
+
+class ResultUpload:
+    """
+    The stored objects of one enhancement result, uploaded concurrently on
+    the shared upload pool as soon as each one is available. Objects share a
+    file id; if any upload fails, abort() removes the ones that were written,
+    so a failed request leaves no partial result behind.
+    """
+
+    # Variant name -> (key in the returned keys, key prefix)
+    LAYOUT = {
+        'original': ('original_url', 'original'),
+        'full': ('enhanced_url', 'enhanced'),
+        'preview': ('preview_url', 'previews'),
+        'thumbnail': ('thumbnail_url', 'thumbnails'),
+    }
+
+    def __init__(self, storage: "StorageService", file_id: Optional[str] = None):
+        self.storage = storage
+        self.file_id = file_id or str(uuid.uuid4())
+        self._uploads: Dict[str, tuple[str, Future]] = {}
+
+    def put(self, name: str, data: Union[bytes, ImageContext]) -> Future:
+        """Start uploading one object; variants are stored as PNG, the original in its own format"""
+        field, prefix = self.LAYOUT[name]
+        extension = data.extension if isinstance(data, ImageContext) else "png"
+        key = f"{prefix}/{self.file_id}.{extension}"
+        future = upload_executor.submit(self._upload, name, key, data)
+        self._uploads[name] = (key, future)
+        return future
+
+    def _upload(self, name: str, key: str, data: Union[bytes, ImageContext]):
+        self.storage.put_verified(key, data)
+        size = len(data.data) if isinstance(data, ImageContext) else len(data)
+        logger.info(f"Uploaded {name}: {key} ({size} bytes)")
+
+    def keys(self, *names: str) -> dict[str, str]:
+        """Wait for the uploads of names (all by default), returning their keys; raises if one failed"""
+        selected = [name for name in (names or self._uploads) if name in self._uploads]
+        for name in selected:
+            self._uploads[name][1].result()
+        return {self.LAYOUT[name][0]: self._uploads[name][0] for name in selected}
+
+    async def wait(self, *names: str) -> dict[str, str]:
+        """keys() without blocking the event loop"""
+        selected = [name for name in (names or self._uploads) if name in self._uploads]
+        await asyncio.gather(*(asyncio.wrap_future(self._uploads[name][1]) for name in selected))
+        return self.keys(*selected)
+
+    def abort(self):
+        """Stop pending uploads and remove the objects that were already written"""
+        for _, future in self._uploads.values():
+            future.cancel()
+        written = []
+        for key, future in self._uploads.values():
+            if future.cancelled():
+                continue
+            try:
+                future.result()
+                written.append(key)
+            except Exception:
+                pass
+
+        upload_stats.aborted += 1
+        for key in written:
+            try:
+                self.storage.client.remove_object(self.storage.bucket, key)
+                presigned_url_cache.invalidate(key)
+                upload_stats.removed += 1
+            except Exception as e:
+                logger.error(f"Failed to remove {key} after a failed upload: {e}")
+        logger.warning(f"Aborted upload of result {self.file_id}, removed {len(written)} stored objects")
+
+
 class StorageService:
     def __init__(self):
         self.client = Minio(
             settings.MINIO_ENDPOINT,
             access_key=settings.MINIO_ACCESS_KEY,
             secret_key=settings.MINIO_SECRET_KEY,
-            secure=settings.MINIO_SECURE
+            secure=settings.MINIO_SECURE,
+            http_client=self._http_client()
         )
         self.bucket = settings.MINIO_BUCKET
+
+    @staticmethod
+    def _http_client() -> urllib3.PoolManager:
+        """Minio's default connection pool, with a configurable size and timeouts"""
+        return urllib3.PoolManager(
+            maxsize=settings.MINIO_POOL_MAXSIZE,
+            timeout=urllib3.Timeout(connect=settings.MINIO_CONNECT_TIMEOUT_SECONDS, read=settings.MINIO_READ_TIMEOUT_SECONDS),
+            cert_reqs="CERT_REQUIRED",
+            ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+            retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+        )
     
     def initialize(self):
         try:
@@ -28,50 +181,95 @@ class StorageService:
             print(f"WARNING: MinIO connection failed: {e}")
             print(f"MinIO endpoint: {settings.MINIO_ENDPOINT}")
             print("The app will start but image storage won't work until MinIO is available.")
+
+    def prewarm(self, connections: int):
+        """Open up to connections keep-alive connections to MinIO ahead of the first requests"""
+        if connections <= 0:
+            return
+        start = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="storage-prewarm") as pool:
+                list(pool.map(lambda _: self.client.bucket_exists(self.bucket), range(connections)))
+            logger.info(f"Pre-warmed {connections} MinIO connections in {(time.monotonic() - start) * 1000:.0f}ms")
+        except Exception as e:
+            logger.warning(f"MinIO connection pre-warm failed: {e}")
     
-    def upload_image(self, image_data: bytes, prefix: str = "original") -> str:
+    def upload_image(self, image: Union[bytes, ImageContext], prefix: str = "original") -> str:
         file_id = str(uuid.uuid4())
-        key = f"{prefix}/{file_id}.png"
+
+        # Validate image data before upload (header only)
+        try:
+            ctx = image if isinstance(image, ImageContext) else ImageContext.probe(image)
+            logger.debug(f"Image validation successful - format: {ctx.format}, mode: {ctx.mode}, size: {ctx.size}")
+        except Exception as img_error:
+            logger.error(f"Image validation failed before upload: {img_error}")
+            raise Exception(f"Storage upload failed: Invalid image data: {img_error}")
+
+        image_data = ctx.data
+        key = f"{prefix}/{file_id}.{ctx.extension}"
 
         logger.info(f"Uploading image - Key: {key}, Size: {len(image_data)} bytes")
 
         try:
-            # Validate image data before upload
-            try:
-                test_img = Image.open(io.BytesIO(image_data))
-                logger.debug(f"Image validation successful - format: {test_img.format}, mode: {test_img.mode}, size: {test_img.size}")
-            except Exception as img_error:
-                logger.error(f"Image validation failed before upload: {img_error}")
-                raise Exception(f"Invalid image data: {img_error}")
-
-            # Upload to S3/MinIO
-            self.client.put_object(
-                self.bucket,
-                key,
-                io.BytesIO(image_data),
-                len(image_data)
-            )
+            # Upload to S3/MinIO, checked against the content hashes
+            self.put_verified(key, ctx)
 
             logger.info(f"Successfully uploaded image to {key}")
 
-            # Verify the upload by reading it back
-            try:
-                retrieved_data = self.get_image(key)
-                if retrieved_data != image_data:
-                    logger.error(f"Data integrity check failed for {key} - retrieved size: {len(retrieved_data)}, expected: {len(image_data)}")
-                    raise Exception("Data integrity check failed after upload")
-                else:
-                    logger.debug(f"Data integrity check passed for {key}")
-            except Exception as verify_error:
-                logger.error(f"Upload verification failed for {key}: {verify_error}")
-                raise Exception(f"Upload verification failed: {verify_error}")
-
             return key
 
         except Exception as e:
             logger.error(f"Failed to upload image {key}: {e}", exc_info=True)
             raise Exception(f"Storage upload failed: {e}")
     
+    def put_verified(self, key: str, data: Union[bytes, ImageContext], content_type: str = "image/png"):
+        """
+        Upload one object and check that it arrived intact, without reading it back.
+
+        The client already sends a Content-MD5 (https) or a signed payload
+        SHA-256 (http) that the server checks; the ETag it answers with is
+        then compared with the MD5 computed here. The SHA-256 is stored as
+        object metadata (x-amz-meta-sha256). A STORAGE_DEEP_VERIFY_RATE share
+        of uploads is also read back and compared in full.
+        """
+        if isinstance(data, ImageContext):
+            body, stream, sha256, content_type = data.data, data.open(), data.sha256, data.content_type
+        else:
+            body, stream, sha256 = data, io.BytesIO(data), hashlib.sha256(data).hexdigest()
+        md5 = hashlib.md5(body, usedforsecurity=False).hexdigest()
+
+        start = time.monotonic()
+        result = self.client.put_object(
+            self.bucket,
+            key,
+            stream,
+            len(body),
+            content_type=content_type,
+            metadata={"sha256": sha256}
+        )
+        put_seconds = time.monotonic() - start
+
+        etag = (getattr(result, "etag", None) or "").strip('"')
+        etag_checked = bool(settings.STORAGE_VERIFY_ETAG and etag and "-" not in etag and len(etag) == 32)
+        if etag_checked and etag != md5:
+            upload_stats.failed += 1
+            logger.error(f"Data integrity check failed for {key} - ETag: {etag}, expected MD5: {md5}")
+            raise Exception(f"Upload verification failed: ETag {etag} does not match MD5 {md5}")
+        # Multipart and SSE-KMS ETags are not the MD5 of the content; the transport checksum still applies
+
+        deep_seconds = None
+        if settings.STORAGE_DEEP_VERIFY_RATE > 0 and random.random() < settings.STORAGE_DEEP_VERIFY_RATE:
+            deep_start = time.monotonic()
+            retrieved_data = self.get_image(key)
+            deep_seconds = time.monotonic() - deep_start
+            if hashlib.sha256(retrieved_data).hexdigest() != sha256:
+                upload_stats.failed += 1
+                logger.error(f"Deep verification failed for {key} - retrieved size: {len(retrieved_data)}, expected: {len(body)}")
+                raise Exception("Data integrity check failed after upload")
+            logger.debug(f"Deep verification passed for {key}")
+
+        upload_stats.record(len(body), put_seconds, etag_checked, deep_seconds)
+
     def get_image(self, key: str) -> bytes:
         logger.debug(f"Retrieving image: {key}")
         try:
@@ -83,46 +281,81 @@ class StorageService:
             logger.error(f"Failed to retrieve image {key}: {e}")
             raise Exception(f"Failed to retrieve image: {e}")
     
-    def upload_original_and_enhanced(self, original_data: bytes, enhanced_data: bytes) -> tuple[str, str]:
-        logger.info(f"Uploading original and enhanced images - Original: {len(original_data)} bytes, Enhanced: {len(enhanced_data)} bytes")
-        original_key = self.upload_image(original_data, "original")
+    def stat_image(self, key: str):
+        """Object metadata (etag, size, last_modified, content_type); raises S3Error when missing"""
+        return self.client.stat_object(self.bucket, key)
+
+    def stream_image(self, key: str, offset: int = 0, length: int = 0, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """
+        Object bytes in chunks of chunk_size, optionally only length bytes from
+        offset, without holding the object in memory. The request is made
+        before returning, so a missing object raises here.
+        """
+        response = self.client.get_object(self.bucket, key, offset=offset, length=length)
+
+        def chunks() -> Iterator[bytes]:
+            try:
+                yield from response.stream(chunk_size)
+            finally:
+                response.close()
+                response.release_conn()
+
+        return chunks()
+
+    def upload_original_and_enhanced(self, original: Union[bytes, ImageContext], enhanced_data: bytes) -> tuple[str, str]:
+        original_size = len(original.data) if isinstance(original, ImageContext) else len(original)
+        logger.info(f"Uploading original and enhanced images - Original: {original_size} bytes, Enhanced: {len(enhanced_data)} bytes")
+        original_key = self.upload_image(original, "original")
         enhanced_key = self.upload_image(enhanced_data, "enhanced")
         logger.info(f"Upload completed - Original key: {original_key}, Enhanced key: {enhanced_key}")
         return original_key, enhanced_key
 
-    def upload_multi_size_images(self, original_data: bytes, enhanced_sizes: dict[str, bytes]) -> dict[str, str]:
-        """Upload original and multiple sizes of enhanced image (thumbnail, preview, full)"""
-        file_id = str(uuid.uuid4())
+    def upload_multi_size_images(
+        self,
+        original: Union[bytes, ImageContext],
+        enhanced_sizes: dict[str, bytes],
+        on_preview: Optional[Callable[[dict[str, str]], None]] = None
+    ) -> dict[str, str]:
+        """
+        Upload original and multiple sizes of enhanced image (thumbnail, preview, full),
+        concurrently on the upload pool. on_preview is called with the small
+        variants' keys as soon as those are stored. If any upload fails, the
+        objects already written are removed.
+        """
+        upload = ResultUpload(self)
+        try:
+            for name in ('thumbnail', 'preview', 'full'):
+                if name in enhanced_sizes:
+                    upload.put(name, enhanced_sizes[name])
+            # Upload original in the format it was received in
+            upload.put('original', original if isinstance(original, ImageContext) else ImageContext.probe(original))
 
-        keys = {}
+            if on_preview:
+                on_preview(upload.keys('thumbnail', 'preview'))
+            return upload.keys()
+        except Exception:
+            upload.abort()
+            raise
 
-        # Upload original
-        original_key = f"original/{file_id}.png"
-        self.client.put_object(self.bucket, original_key, io.BytesIO(original_data), len(original_data))
-        keys['original_url'] = original_key
-        logger.info(f"Uploaded original: {original_key}")
+    def upload_small_variants(self, enhanced_sizes: dict[str, bytes], file_id: Optional[str] = None) -> dict[str, str]:
+        """Upload the thumbnail and preview variants, returning their keys"""
+        file_id = file_id or str(uuid.uuid4())
+        keys = {}
 
         # Upload thumbnail
         if 'thumbnail' in enhanced_sizes:
             thumbnail_key = f"thumbnails/{file_id}.png"
-            self.client.put_object(self.bucket, thumbnail_key, io.BytesIO(enhanced_sizes['thumbnail']), len(enhanced_sizes['thumbnail']))
+            self.put_verified(thumbnail_key, enhanced_sizes['thumbnail'])
             keys['thumbnail_url'] = thumbnail_key
             logger.info(f"Uploaded thumbnail: {thumbnail_key} ({len(enhanced_sizes['thumbnail'])} bytes)")
 
         # Upload preview
         if 'preview' in enhanced_sizes:
             preview_key = f"previews/{file_id}.png"
-            self.client.put_object(self.bucket, preview_key, io.BytesIO(enhanced_sizes['preview']), len(enhanced_sizes['preview']))
+            self.put_verified(preview_key, enhanced_sizes['preview'])
             keys['preview_url'] = preview_key
             logger.info(f"Uploaded preview: {preview_key} ({len(enhanced_sizes['preview'])} bytes)")
 
-        # Upload full
-        if 'full' in enhanced_sizes:
-            full_key = f"enhanced/{file_id}.png"
-            self.client.put_object(self.bucket, full_key, io.BytesIO(enhanced_sizes['full']), len(enhanced_sizes['full']))
-            keys['enhanced_url'] = full_key
-            logger.info(f"Uploaded full: {full_key} ({len(enhanced_sizes['full'])} bytes)")
-
         return keys
 
     def get_full_url(self, key: str) -> str:
@@ -146,21 +379,29 @@ class StorageService:
         logger.debug(f"Generated full URL: {full_url} for key: {key}")
         return full_url
 
-    def get_presigned_url(self, key: str, expires_in: int = 3600) -> str:
-        """Generate a presigned URL for S3/MinIO object access"""
+    def get_presigned_url(self, key: str, expires_in: Optional[int] = None) -> str:
+        """
+        Presigned URL for S3/MinIO object access. The same URL is reused until
+        it is PRESIGNED_URL_REUSE_FRACTION through its lifetime, so clients can
+        cache images by URL.
+        """
         if not key:
             return None
 
+        expires_in = expires_in or settings.PRESIGNED_URL_EXPIRES_SECONDS
+        cached = presigned_url_cache.get(key, expires_in)
+        if cached:
+            return cached
+
         try:
-            # Generate presigned URL with default 1 hour expiration
             presigned_url = self.client.presigned_get_object(
                 bucket_name=self.bucket,
                 object_name=key,
                 expires=timedelta(seconds=expires_in)
             )
+            presigned_url_cache.put(key, expires_in, presigned_url)
 
-            logger.info(f"Generated presigned URL for key {key}: expires in {expires_in}s")
-            logger.debug(f"Presigned URL: {presigned_url}")
+            logger.debug(f"Generated presigned URL for key {key}: expires in {expires_in}s")
 
             return presigned_url
 
@@ -0,0 +1,166 @@
+"""
+Tiled enhancement for images larger than one model call accepts.
+
+The prepared image is split into overlapping tiles no larger than the
+backend's target size. The tiles are enhanced concurrently through the
+backend (and so through the shared upstream admission control), and the
+results are blended back together on the image process pool. Inside each
+overlap the two neighbouring tiles are cross-faded linearly, so seams do
+not show.
+"""
+import io
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from .image_process_pool import image_pool
+from .progress import report
+from ..config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]
+
+
+def tile_starts(length: int, tile: int, overlap: int) -> List[int]:
+    """Evenly spaced tile offsets along one axis, neighbours overlapping by at least overlap"""
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    stride = (length - tile) / (count - 1)
+    return [round(i * stride) for i in range(count)]
+
+
+def plan_tiles(size: Tuple[int, int], tile: Tuple[int, int], overlap: int) -> List[Box]:
+    """Tile boxes (left, upper, right, lower) covering size, in row-major order"""
+    width, height = size
+    tile_w, tile_h = min(tile[0], width), min(tile[1], height)
+    # Keep the overlap well below the tile size so the tile count stays low
+    overlap_x = min(overlap, tile_w // 4)
+    overlap_y = min(overlap, tile_h // 4)
+    return [
+        (left, upper, left + tile_w, upper + tile_h)
+        for upper in tile_starts(height, tile_h, overlap_y)
+        for left in tile_starts(width, tile_w, overlap_x)
+    ]
+
+
+def feather(start: int, end: int, starts: List[int], ends: List[int]) -> np.ndarray:
+    """
+    Blend weights along one axis of the tile spanning start..end: a linear
+    ramp over the overlap with each neighbour, complementary to the
+    neighbour's, and 1 elsewhere
+    """
+    weights = np.ones(end - start, dtype=np.float32)
+    lead = max([e - start for s, e in zip(starts, ends) if s < start < e], default=0)
+    trail = max([end - s for s, e in zip(starts, ends) if s < end < e and s > start], default=0)
+    if lead:
+        weights[:lead] = (np.arange(lead) + 0.5) / lead
+    if trail:
+        weights[-trail:] = np.minimum(weights[-trail:], (trail - np.arange(trail) - 0.5) / trail)
+    return weights
+
+
+def blend_tiles(size: Tuple[int, int], boxes: List[Box], tiles: List[bytes]) -> bytes:
+    """Process-pool entry point: feather-blend encoded tile outputs into one PNG"""
+    width, height = size
+    canvas = np.zeros((height, width, 3), dtype=np.float32)
+    total = np.zeros((height, width, 1), dtype=np.float32)
+    lefts, rights = [b[0] for b in boxes], [b[2] for b in boxes]
+    uppers, lowers = [b[1] for b in boxes], [b[3] for b in boxes]
+
+    for (left, upper, right, lower), data in zip(boxes, tiles):
+        img = Image.open(io.BytesIO(data)).convert("RGB")
+        if img.size != (right - left, lower - upper):
+            # The model may answer at another size; fit the output back onto its tile
+            img = img.resize((right - left, lower - upper), Image.Resampling.LANCZOS)
+        weight = np.outer(feather(upper, lower, uppers, lowers), feather(left, right, lefts, rights))[:, :, None]
+        canvas[upper:lower, left:right] += np.asarray(img, dtype=np.float32) * weight
+        total[upper:lower, left:right] += weight
+
+    pixels = np.clip(np.rint(canvas / np.maximum(total, 1e-6)), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, "RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class TiledEnhancer:
+    """
+    Runs one enhancement as several tile calls. At most max_parallel tiles of
+    an image are in flight at once, so a large scan does not take every
+    upstream slot; the upstream limiter still bounds calls across requests.
+    """
+
+    def __init__(self, overlap: int = 192, max_parallel: int = 4):
+        self.overlap = overlap
+        self.max_parallel = max_parallel
+        self.images = 0
+        self.tiles = 0
+        self.failed_tiles = 0
+        self._tile_latencies: Deque[float] = deque(maxlen=1000)
+
+    async def enhance(self, backend, img: Image.Image, resolution: str, mode: str = "enhance", filter_type: Optional[str] = None, custom_prompt: Optional[str] = None) -> bytes:
+        boxes = plan_tiles(img.size, backend.target_size(resolution), self.overlap)
+        slots = asyncio.Semaphore(max(1, self.max_parallel))
+        done = [0]
+        logger.info(f"Tiled enhancement - Mode: {mode}, Size: {img.size}, Tiles: {len(boxes)}, Overlap: {self.overlap}px")
+
+        async def run_tile(box: Box) -> bytes:
+            async with slots:
+                tile = img.crop(box)
+                start = time.monotonic()
+                try:
+                    output = await backend.enhance(tile, resolution, mode, filter_type, custom_prompt)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self.failed_tiles += 1
+                    raise
+                latency = time.monotonic() - start
+                self._tile_latencies.append(latency)
+                self.tiles += 1
+                done[0] += 1
+                report("tile", completed=done[0], total=len(boxes), duration_ms=round(latency * 1000, 1))
+                return output
+
+        start = time.monotonic()
+        tasks = [asyncio.create_task(run_tile(box)) for box in boxes]
+        try:
+            outputs = await asyncio.gather(*tasks)
+        finally:
+            # One failed tile fails the image; stop spending calls on the rest
+            for task in tasks:
+                task.cancel()
+
+        self.images += 1
+        logger.info(f"Tiled enhancement model calls done - Tiles: {len(boxes)}, Time: {time.monotonic() - start:.1f}s")
+        return await image_pool.run(blend_tiles, img.size, boxes, outputs)
+
+    def _latency_percentile(self, fraction: float) -> float:
+        if not self._tile_latencies:
+            return 0.0
+        ordered = sorted(self._tile_latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def stats(self) -> Dict[str, object]:
+        latencies = self._tile_latencies
+        return {
+            "images": self.images,
+            "tiles": self.tiles,
+            "failed_tiles": self.failed_tiles,
+            "tiles_per_image": round(self.tiles / self.images, 1) if self.images else 0.0,
+            "tile_ms_avg": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+            "tile_ms_p50": round(self._latency_percentile(0.5) * 1000, 1),
+            "tile_ms_p95": round(self._latency_percentile(0.95) * 1000, 1),
+            "tile_ms_max": round(max(latencies) * 1000, 1) if latencies else 0.0,
+        }
+
+
+tiled_enhancer = TiledEnhancer(
+    overlap=settings.TILED_OVERLAP,
+    max_parallel=settings.TILED_MAX_PARALLEL
+)
@@ -0,0 +1,183 @@
+import io
+import os
+import asyncio
+import logging
+import resource
+import tempfile
+from typing import Dict, Optional
+from PIL import Image
+from fastapi import HTTPException, UploadFile
+from ..config.settings import settings
+from .image_context import ImageContext
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# The image header has to show up within this many bytes (JPEG EXIF blocks are at most 64KB)
+HEADER_PROBE_LIMIT = 1024 * 1024
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """High-water mark of this process's resident set size"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class UploadIngest:
+    """
+    Bounded intake of uploaded images.
+
+    By the time a route calls ingest(), the form parser has already received
+    and spooled the whole request body; oversized bodies are refused before
+    that by UploadSizeLimitMiddleware. Here the spooled upload is read in
+    chunks, the size limit is checked again per file (a batch body may hold
+    several), and the header is probed from the first chunk so oversized
+    dimensions (decompression bombs) are refused before the rest is copied.
+    Uploads up to the spool threshold stay in memory; larger ones are copied
+    to a temp file that decoders read through mmap, so a request never holds
+    more than the threshold of encoded bytes in memory.
+    """
+
+    def __init__(self, max_bytes: int, max_pixels: int, spool_threshold: int, spool_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.spool_threshold = spool_threshold
+        self.spool_dir = spool_dir
+        self.accepted = 0
+        self.spooled = 0
+        self.rejected_size = 0
+        self.rejected_pixels = 0
+        self.rejected_invalid = 0
+        self.largest_bytes = 0
+
+    async def ingest(self, file: UploadFile) -> ImageContext:
+        """Read an upload into an ImageContext; the caller should close() it when done"""
+        rss_before = current_rss_mb()
+
+        if file.size is not None and file.size > self.max_bytes:
+            self._reject_size(file.filename, file.size)
+
+        buffer = bytearray()
+        spool = None
+        source = None
+        total = 0
+        header_checked = False
+        try:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > self.max_bytes:
+                    self._reject_size(file.filename, total)
+
+                if spool is not None:
+                    await asyncio.to_thread(spool.write, chunk)
+                    continue
+
+                buffer += chunk
+                if not header_checked:
+                    header_checked = self._check_header(file.filename, buffer)
+                if len(buffer) > self.spool_threshold:
+                    if not header_checked:
+                        raise ValueError("Invalid image data: no image header found")
+                    spool = tempfile.NamedTemporaryFile(prefix="upload-", dir=self.spool_dir, delete=False)
+                    await asyncio.to_thread(spool.write, buffer)
+                    buffer = bytearray()
+
+            if spool is not None:
+                spool.close()
+                source = ImageContext.from_file(spool.name, delete=True)
+                self.spooled += 1
+            else:
+                source = ImageContext.probe(bytes(buffer))
+        except ValueError as e:
+            self.rejected_invalid += 1
+            raise HTTPException(status_code=400, detail=str(e))
+        finally:
+            if spool is not None:
+                spool.close()
+                if source is None:
+                    _remove(spool.name)
+
+        self.accepted += 1
+        self.largest_bytes = max(self.largest_bytes, total)
+        logger.info(f"Ingested upload {file.filename}: {total / 1024:.1f}KB, {source.format} {source.width}x{source.height}, "
+                    f"spooled: {spool is not None}, RSS {rss_before:.0f}MB -> {current_rss_mb():.0f}MB (peak {peak_rss_mb():.0f}MB)")
+        return source
+
+    def _check_header(self, filename: str, head: bytearray) -> bool:
+        """
+        Probe dimensions from the bytes read so far and check them against
+        max_pixels; False if more bytes are needed. Pillow's process-wide
+        decompression bomb guard is left at its default, so it can still
+        refuse an image first when max_pixels is set above its hard limit.
+        """
+        try:
+            with Image.open(io.BytesIO(head)) as img:
+                width, height = img.size
+        except Image.DecompressionBombError as e:
+            self.rejected_pixels += 1
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception:
+            if len(head) > HEADER_PROBE_LIMIT:
+                raise ValueError("Invalid image data: no image header found")
+            return False
+
+        self._check_pixels(filename, width, height)
+        return True
+
+    def _check_pixels(self, filename: str, width: int, height: int):
+        if width * height > self.max_pixels:
+            self.rejected_pixels += 1
+            logger.warning(f"Rejected upload {filename}: {width}x{height} exceeds {self.max_pixels} pixels")
+            raise HTTPException(
+                status_code=413,
+                detail=f"Image is too large: {width}x{height} exceeds {self.max_pixels / 1_000_000:.0f} megapixels"
+            )
+
+    def _reject_size(self, filename: str, size: int):
+        self.rejected_size += 1
+        logger.warning(f"Rejected upload {filename}: {size} bytes exceeds {self.max_bytes}")
+        raise HTTPException(
+            status_code=413,
+            detail=f"File is too large: the maximum upload size is {self.max_bytes / (1024 * 1024):.0f}MB"
+        )
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "accepted": self.accepted,
+            "spooled": self.spooled,
+            "rejected_size": self.rejected_size,
+            "rejected_pixels": self.rejected_pixels,
+            "rejected_invalid": self.rejected_invalid,
+            "largest_bytes": self.largest_bytes,
+            "max_bytes": self.max_bytes,
+            "max_pixels": self.max_pixels,
+            "rss_mb": round(current_rss_mb(), 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+
+def _remove(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+upload_ingest = UploadIngest(
+    max_bytes=settings.UPLOAD_MAX_BYTES,
+    max_pixels=settings.UPLOAD_MAX_PIXELS,
+    spool_threshold=settings.UPLOAD_SPOOL_THRESHOLD_BYTES,
+    spool_dir=settings.UPLOAD_SPOOL_DIR
+)
@@ -0,0 +1,250 @@
+import sys
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+# Import from backend root directory
+sys.path.append('/app')
+from image_enhancement import UpstreamRejected
+from ..config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """True for Gemini 429 / RESOURCE_EXHAUSTED errors"""
+    return getattr(error, "code", None) == 429 or "RESOURCE_EXHAUSTED" in str(error)
+
+
+class TokenBucket:
+    """Continuously refilled token bucket; a rate of 0 disables the limit"""
+
+    def __init__(self, per_minute: int, burst: Optional[int] = None):
+        self.rate = max(0, per_minute) / 60.0
+        self.capacity = float(burst or per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds until amount tokens are available, 0 if they are available now"""
+        if not self.enabled:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        if self.enabled:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+    def drain(self):
+        """Empty the bucket, e.g. after the upstream reported we are over quota"""
+        if self.enabled:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit. Every healthy call adds 1/limit, so the limit
+    grows by one per limit's worth of calls; a 429 halves it and a call
+    slower than the latency target shrinks it by 10%. Decreases are applied
+    at most once per cooldown, so a burst of failures from calls that were
+    started together only counts once.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_target: float, cooldown: float = 5.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self._last_decrease = 0.0
+
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+    def on_success(self, latency: float):
+        if self.latency_target and latency > self.latency_target:
+            self._decrease(0.9)
+        else:
+            self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+
+    def on_rate_limited(self):
+        self._decrease(0.5)
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.minimum), self.limit * factor)
+
+
+class UpstreamQuota:
+    """
+    Admission control for Gemini calls within one worker process.
+
+    A call is admitted once the adaptive concurrency limit has room and the
+    request (RPM) and token (TPM) buckets can cover it. Until then it waits
+    in a bounded queue; calls that find the queue full, or wait longer than
+    the queue timeout, are refused with UpstreamRejected.
+    """
+
+    def __init__(
+        self,
+        rpm: int = 0,
+        tpm: int = 0,
+        initial_concurrency: int = 4,
+        min_concurrency: int = 1,
+        max_concurrency: int = 16,
+        latency_target: float = 45.0,
+        max_queue: int = 64,
+        queue_timeout: float = 120.0
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.limit = AdaptiveLimit(initial_concurrency, min_concurrency, max_concurrency, latency_target)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._changed: Optional[asyncio.Event] = None
+        self._wait_times: Deque[float] = deque(maxlen=1000)
+        self.granted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.rate_limited = 0
+
+    @asynccontextmanager
+    async def permit(self, tokens: int = 0) -> AsyncIterator[None]:
+        """Hold a slot for one upstream call; the outcome of the call feeds the limit"""
+        await self._acquire(tokens)
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if is_rate_limited(e):
+                self.rate_limited += 1
+                self.limit.on_rate_limited()
+                self.requests.drain()
+                self.tokens.drain()
+                logger.warning(f"Gemini rate limited us, concurrency limit now {self.limit.current}")
+            raise
+        else:
+            self.limit.on_success(time.monotonic() - start)
+        finally:
+            self.in_flight -= 1
+            self._wake()
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], tokens: int = 0) -> Any:
+        """Run fn, a coroutine function making one upstream request, under a permit"""
+        async with self.permit(tokens):
+            return await fn()
+
+    async def _acquire(self, tokens: int):
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Gemini request queue full ({self.waiting} waiting), rejecting call")
+            raise UpstreamRejected("Too many pending enhancement requests, please retry later", self._retry_after())
+
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        self.waiting += 1
+        try:
+            while True:
+                if self.in_flight < self.limit.current:
+                    delay = max(self.requests.delay_for(1), self.tokens.delay_for(tokens))
+                    if delay == 0:
+                        break
+                else:
+                    delay = None
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timed_out += 1
+                    logger.warning(f"Gemini call waited {self.queue_timeout:.0f}s for a permit, giving up")
+                    raise UpstreamRejected("Enhancement service is busy, please retry later", self._retry_after())
+                await self._wait_for_change(remaining if delay is None else min(remaining, delay))
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.granted += 1
+
+        waited = time.monotonic() - start
+        self._wait_times.append(waited)
+        if waited > 1:
+            logger.info(f"Gemini call admitted after {waited:.1f}s (in flight: {self.in_flight}, limit: {self.limit.current})")
+
+    async def _wait_for_change(self, timeout: float):
+        """Sleep until a permit is released or timeout passes"""
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _wake(self):
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+    def _retry_after(self) -> float:
+        return max(1.0, self.requests.delay_for(1), self._wait_percentile(0.5))
+
+    def _wait_percentile(self, fraction: float) -> float:
+        if not self._wait_times:
+            return 0.0
+        ordered = sorted(self._wait_times)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def stats(self) -> Dict[str, object]:
+        waits = self._wait_times
+        return {
+            "concurrency_limit": self.limit.current,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "rate_limited": self.rate_limited,
+            "wait_ms_avg": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            "wait_ms_p95": round(self._wait_percentile(0.95) * 1000, 1),
+            "wait_ms_max": round(max(waits) * 1000, 1) if waits else 0.0,
+            "rpm_available": math.floor(self.requests.tokens) if self.requests.enabled else None,
+            "tpm_available": math.floor(self.tokens.tokens) if self.tokens.enabled else None,
+        }
+
+
+upstream_quota = UpstreamQuota(
+    rpm=settings.GEMINI_RPM_LIMIT,
+    tpm=settings.GEMINI_TPM_LIMIT,
+    initial_concurrency=settings.GEMINI_INITIAL_CONCURRENCY,
+    min_concurrency=settings.GEMINI_MIN_CONCURRENCY,
+    max_concurrency=settings.GEMINI_MAX_CONCURRENCY,
+    latency_target=settings.GEMINI_LATENCY_TARGET_SECONDS,
+    max_queue=settings.GEMINI_QUEUE_SIZE,
+    queue_timeout=settings.GEMINI_QUEUE_TIMEOUT_SECONDS
+)
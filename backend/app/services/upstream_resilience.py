@@ -0,0 +1,263 @@
+import sys
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+import httpx
+
+# Import from backend root directory
+sys.path.append('/app')
+from image_enhancement import UpstreamRejected
+from ..config.settings import settings
+from .upstream_quota import UpstreamQuota, is_rate_limited, upstream_quota
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Transient upstream failures: throttling, 5xx, timeouts and dropped connections"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError, httpx.TransportError))
+
+
+def server_retry_delay(error: BaseException) -> Optional[float]:
+    """Delay requested by Gemini in a 429 (google.rpc.RetryInfo), if any"""
+    details = getattr(error, "details", None)
+    if not isinstance(details, dict):
+        return None
+    for detail in details.get("error", {}).get("details", []):
+        delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+        if isinstance(delay, str) and delay.endswith("s"):
+            try:
+                return float(delay[:-1])
+            except ValueError:
+                return None
+    return None
+
+
+class CircuitBreaker:
+    """
+    Opens after a run of consecutive upstream failures and rejects calls
+    until the cooldown has passed. It then lets a single probe call through
+    (half-open); the probe's outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+
+    def retry_after(self) -> float:
+        return max(1.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def before_call(self):
+        """Raise UpstreamRejected unless a call may go upstream now"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                raise UpstreamRejected("Enhancement service is temporarily unavailable, please retry later", self.retry_after())
+            self.state = self.HALF_OPEN
+            logger.info("Gemini circuit breaker half-open, sending a probe call")
+
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                raise UpstreamRejected("Enhancement service is recovering, please retry later", self.cooldown)
+            self._probing = True
+
+    def on_success(self):
+        if self.state != self.CLOSED:
+            logger.info("Gemini circuit breaker closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def on_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"Gemini circuit breaker opened after {self.failures} failures, "
+                               f"rejecting calls for {self.cooldown:.0f}s")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def on_cancel(self):
+        """A probe that was cancelled says nothing about upstream health"""
+        self._probing = False
+
+
+class UpstreamResilience:
+    """
+    Retry, hedging and circuit breaking around upstream model calls.
+
+    Each attempt is admitted by the quota manager and bounded by a timeout.
+    Retryable failures are retried with full-jitter exponential backoff.
+    With hedging enabled, an attempt that runs past the recent p95 latency
+    gets a second, identical request and the first result wins; hedges are
+    capped at a fraction of all calls.
+    """
+
+    def __init__(
+        self,
+        quota: UpstreamQuota,
+        call_timeout: float = 90.0,
+        max_attempts: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 20.0,
+        hedge_enabled: bool = False,
+        hedge_budget: float = 0.05,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.quota = quota
+        self.call_timeout = call_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_enabled = hedge_enabled
+        self.hedge_budget = hedge_budget
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies: Deque[float] = deque(maxlen=500)
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failures = 0
+        self.short_circuited = 0
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], tokens: int = 0) -> Any:
+        """Run fn, a coroutine function making one upstream request, with retries"""
+        self.calls += 1
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.breaker.before_call()
+            except UpstreamRejected:
+                self.short_circuited += 1
+                raise
+
+            try:
+                result = await self._hedged(fn, tokens)
+            except UpstreamRejected:
+                self.breaker.on_cancel()
+                raise
+            except asyncio.CancelledError:
+                self.breaker.on_cancel()
+                raise
+            except Exception as e:
+                retryable = is_retryable(e)
+                if retryable and not is_rate_limited(e):
+                    # Throttling is handled by the quota manager, it does not mean upstream is down
+                    self.breaker.on_failure()
+                else:
+                    self.breaker.on_cancel()
+
+                if not retryable or attempt == self.max_attempts:
+                    self.failures += 1
+                    if is_rate_limited(e):
+                        raise UpstreamRejected("Enhancement capacity exhausted, please retry later",
+                                               server_retry_delay(e) or self.max_delay)
+                    raise
+
+                delay = self._backoff(attempt, e)
+                self.retries += 1
+                logger.warning(f"Gemini call failed (attempt {attempt}/{self.max_attempts}): {e}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            else:
+                self.breaker.on_success()
+                return result
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        """Full jitter: uniform between 0 and the exponential cap, or the delay Gemini asked for"""
+        requested = server_retry_delay(error)
+        if requested is not None:
+            return min(self.max_delay, requested)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    async def _attempt(self, fn: Callable[[], Awaitable[Any]], tokens: int) -> Any:
+        async def timed():
+            start = time.monotonic()
+            result = await asyncio.wait_for(fn(), self.call_timeout)
+            self._latencies.append(time.monotonic() - start)
+            return result
+
+        return await self.quota.call(timed, tokens)
+
+    async def _hedged(self, fn: Callable[[], Awaitable[Any]], tokens: int) -> Any:
+        primary = asyncio.create_task(self._attempt(fn, tokens))
+        hedge_after = self._hedge_delay()
+        if hedge_after is None:
+            return await primary
+
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedge_after)
+            if done or self.hedges >= self.hedge_budget * self.calls:
+                return await primary
+
+            self.hedges += 1
+            logger.info(f"Gemini call exceeded p95 ({hedge_after:.1f}s), sending a hedged request")
+            hedge = asyncio.create_task(self._attempt(fn, tokens))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+            # Both failed; report the primary's error
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge_enabled or len(self._latencies) < 20:
+            return None
+        return self._latency_percentile(0.95)
+
+    def _latency_percentile(self, fraction: float) -> float:
+        if not self._latencies:
+            return 0.0
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.times_opened,
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failures": self.failures,
+            "short_circuited": self.short_circuited,
+            "latency_ms_p50": round(self._latency_percentile(0.5) * 1000, 1),
+            "latency_ms_p95": round(self._latency_percentile(0.95) * 1000, 1),
+            "latency_ms_p99": round(self._latency_percentile(0.99) * 1000, 1),
+        }
+
+
+upstream_resilience = UpstreamResilience(
+    upstream_quota,
+    call_timeout=settings.GEMINI_CALL_TIMEOUT_SECONDS,
+    max_attempts=settings.GEMINI_RETRY_ATTEMPTS,
+    base_delay=settings.GEMINI_RETRY_BASE_DELAY_SECONDS,
+    max_delay=settings.GEMINI_RETRY_MAX_DELAY_SECONDS,
+    hedge_enabled=settings.GEMINI_HEDGE_ENABLED,
+    hedge_budget=settings.GEMINI_HEDGE_BUDGET,
+    breaker=CircuitBreaker(settings.GEMINI_BREAKER_FAILURES, settings.GEMINI_BREAKER_COOLDOWN_SECONDS)
+)
@@ -46,6 +46,18 @@ class UserService:
         elif daily_limits["remaining_today"] > 0:
             user.daily_credits_used += 1
     
+    @staticmethod
+    def reserve_credits(user: User, count: int) -> bool:
+        """Deduct count credits at once, or nothing if the user cannot cover all of them"""
+        daily_limits = UserService.check_daily_limits(user)
+        
+        if user.credits + daily_limits["remaining_today"] < count:
+            return False
+        
+        for _ in range(count):
+            UserService.deduct_credits(user)
+        return True
+    
     @staticmethod
     def refund_credits(user: User) -> None:
         if user.daily_credits_used > 0:
@@ -1,3 +1,6 @@
 from .menu_seeder import seed_menu_data_if_needed
+from .single_flight import SingleFlight
+from .blurhash import encode as encode_blurhash
+from .http_cache import RangeNotSatisfiable, etag_matches, not_modified, parse_range, is_immutable_key
 
-__all__ = ["seed_menu_data_if_needed"]
\ No newline at end of file
+__all__ = ["seed_menu_data_if_needed", "SingleFlight", "encode_blurhash", "RangeNotSatisfiable", "etag_matches", "not_modified", "parse_range", "is_immutable_key"]
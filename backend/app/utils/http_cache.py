@@ -0,0 +1,77 @@
+"""
+Conditional and range request helpers for serving stored objects.
+"""
+import os
+import re
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+
+UUID_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+BYTE_RANGE_PATTERN = re.compile(r"^bytes=\s*(\d*)-(\d*)\s*$")
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def quote_etag(etag: str) -> str:
+    return etag if etag.startswith('"') or etag.startswith('W/"') else f'"{etag}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches etag (weak comparison, as for GET)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    strip = lambda tag: tag.strip().removeprefix("W/")
+    return strip(quote_etag(etag)) in {strip(tag) for tag in if_none_match.split(",")}
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    First and last byte position of a single-range Range header for an object
+    of size bytes. None means serve the whole object: no header, another unit,
+    or several ranges, which the caller may ignore. Raises
+    RangeNotSatisfiable when the range lies outside the object.
+    """
+    match = BYTE_RANGE_PATTERN.match(range_header or "")
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+
+    if not start:
+        # Suffix range: the last N bytes
+        suffix = int(end)
+        if suffix == 0 or size == 0:
+            raise RangeNotSatisfiable(range_header)
+        return max(0, size - suffix), size - 1
+
+    first = int(start)
+    last = min(int(end), size - 1) if end else size - 1
+    if first >= size or (end and int(end) < first):
+        raise RangeNotSatisfiable(range_header)
+    return first, last
+
+
+def is_immutable_key(key: str) -> bool:
+    """Object keys named by a fresh uuid are written once and never change"""
+    stem = os.path.splitext(os.path.basename(key))[0]
+    return UUID_PATTERN.match(stem) is not None
+
+
+def not_modified(if_none_match: Optional[str], if_modified_since: Optional[str], etag: str, last_modified: Optional[datetime]) -> bool:
+    """Whether a GET can be answered with 304; If-Modified-Since only counts without If-None-Match"""
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if not if_modified_since or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have one-second resolution
+    return last_modified.replace(microsecond=0) <= since
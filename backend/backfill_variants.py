@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Backfill script for enhancements stored without thumbnail, preview or blurhash
+(filter and custom edit results from before they shared the enhancement
+pipeline). Renders the missing variants from the stored enhanced image so
+history views stop falling back to on-the-fly thumbnails.
+Run this in the production backend container, after production_migration.py:
+python backfill_variants.py [--limit N] [--dry-run]
+"""
+
+import sys
+import os
+import argparse
+sys.path.append('/app')
+
+from sqlalchemy import or_
+from app.models.database import SessionLocal, Enhancement
+from app.services.storage_service import StorageService
+from app.services.image_tasks import render_variants
+
+def run_backfill(limit: int = None, dry_run: bool = False):
+    """Store the missing variants and blurhash of existing enhancements"""
+    print("Starting variant backfill...")
+
+    db = SessionLocal()
+    storage_service = StorageService()
+    updated = 0
+    failed = 0
+
+    try:
+        query = db.query(Enhancement).filter(or_(
+            Enhancement.thumbnail_url.is_(None),
+            Enhancement.preview_url.is_(None),
+            Enhancement.blurhash.is_(None)
+        )).order_by(Enhancement.created_at.desc())
+        if limit:
+            query = query.limit(limit)
+        enhancements = query.all()
+        print(f"Enhancements missing variants: {len(enhancements)}")
+
+        for enhancement in enhancements:
+            if dry_run:
+                print(f"Would backfill {enhancement.id} ({enhancement.mode}): {enhancement.enhanced_url}")
+                continue
+
+            try:
+                # Only the thumbnail and preview are stored; the full size already is
+                enhanced_sizes, blurhash = render_variants(storage_service.get_image(enhancement.enhanced_url), skip=('full',))
+                # Keep the variants under the same file id as the enhanced image
+                file_id = os.path.splitext(os.path.basename(enhancement.enhanced_url))[0]
+                keys = storage_service.upload_small_variants(enhanced_sizes, file_id)
+
+                enhancement.thumbnail_url = enhancement.thumbnail_url or keys.get('thumbnail_url')
+                enhancement.preview_url = enhancement.preview_url or keys.get('preview_url')
+                enhancement.blurhash = enhancement.blurhash or blurhash
+                db.commit()
+                updated += 1
+                print(f"Backfilled {enhancement.id} ({enhancement.mode})")
+            except Exception as e:
+                db.rollback()
+                failed += 1
+                print(f"❌ Backfill failed for {enhancement.id}: {e}")
+
+        if dry_run:
+            print("✅ Dry run completed. No changes made.")
+        else:
+            print(f"✅ Backfill completed! Updated: {updated}, failed: {failed}")
+
+    finally:
+        db.close()
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill thumbnail, preview and blurhash of stored enhancements")
+    parser.add_argument("--limit", type=int, default=None, help="Backfill at most this many enhancements, newest first")
+    parser.add_argument("--dry-run", action="store_true", help="List the enhancements that would be backfilled")
+    args = parser.parse_args()
+    run_backfill(args.limit, args.dry_run)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark: CPU time spent on image handling per /api/enhance request.
+
+Compares the previous flow (PNG re-encode in the route, repeated opens,
+full-size decode in the enhancer, independent decodes for variants and
+blurhash) with the ImageContext decode-once flow, on synthetic 12 MP phone
+photos. The Gemini call is replaced by a stub returning a precomputed PNG,
+so only local CPU work is measured.
+
+Usage:
+    python benchmarks/decode_once.py [--runs 5] [--resolution standard|hd]
+"""
+
+import io
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from image_enhancement import ImageEnhancer
+from app.services.enhancement_service import EnhancementService
+from app.services.image_context import ImageContext
+from app.services import image_tasks
+
+
+def make_phone_photo(width: int = 4032, height: int = 3024, seed: int = 0) -> bytes:
+    """Smooth gradients plus sensor-like noise, saved as a quality 90 JPEG"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        128 + 100 * np.sin(x / width * 3.1 + y / height),
+        128 + 90 * np.cos(y / height * 4.2),
+        128 + 80 * np.sin((x + y) / (width + height) * 6.0),
+    ], axis=-1)
+    noise = rng.normal(0, 8, size=base.shape)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels, "RGB").save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def fake_model_output(upload: bytes, resolution: str) -> bytes:
+    img = Image.open(io.BytesIO(upload))
+    img.thumbnail(ImageEnhancer.target_size(resolution), Image.Resampling.LANCZOS)
+    buf = io.BytesIO()
+    img.convert("RGB").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def legacy_request(upload: bytes, enhanced: bytes, resolution: str):
+    """Image work done by the route/service/storage chain before ImageContext"""
+    def to_png(data):
+        img = Image.open(io.BytesIO(data))
+        if img.format != "PNG":
+            buf = io.BytesIO()
+            img.save(buf, format="PNG")
+            return buf.getvalue()
+        return data
+
+    # Route: convert_to_png
+    png = to_png(upload)
+    # EnhancementService: validation open + second convert_to_png
+    Image.open(io.BytesIO(png))
+    png = to_png(png)
+    # ImageEnhancer: full PNG decode, thumbnail, RGB conversion
+    img = Image.open(io.BytesIO(png))
+    img.thumbnail(ImageEnhancer.target_size(resolution), Image.Resampling.LANCZOS)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    # ImageEnhancer: output validation
+    Image.open(io.BytesIO(enhanced))
+    # generate_multiple_sizes: decode, two copies, three PNG encodes
+    out = Image.open(io.BytesIO(enhanced))
+    for size in ((200, 200), (1080, 1080)):
+        variant = out.copy()
+        variant.thumbnail(size, Image.Resampling.LANCZOS)
+        variant.save(io.BytesIO(), format="PNG")
+    out.save(io.BytesIO(), format="PNG")
+    # generate_blurhash input: another decode + thumbnail
+    blur = Image.open(io.BytesIO(enhanced))
+    blur.thumbnail((100, 100), Image.Resampling.LANCZOS)
+    blur.convert("RGB")
+
+
+class StubEnhancer:
+    target_size = staticmethod(ImageEnhancer.target_size)
+
+    def __init__(self, output: bytes):
+        self.output = output
+
+    async def enhance(self, image, resolution, mode="enhance", filter_type=None, custom_prompt=None):
+        return self.output
+
+
+def context_request(service: EnhancementService, upload: bytes, resolution: str):
+    """Image work done by the current decode-once flow"""
+    source = ImageContext.probe(upload)
+    enhanced_data = asyncio.run(service.enhance_image(source, resolution, "enhance"))
+    image_tasks.render_variants(enhanced_data, skip=tuple(service.stored_as_is(enhanced_data)))
+
+
+def cpu_ms(fn, runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.process_time()
+        fn()
+        samples.append((time.process_time() - start) * 1000)
+    return sum(samples) / len(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--resolution", choices=["standard", "hd"], default="standard")
+    args = parser.parse_args()
+
+    upload = make_phone_photo()
+    enhanced = fake_model_output(upload, args.resolution)
+    print(f"Input: 4032x3024 JPEG, {len(upload) / 1024 / 1024:.1f} MB; "
+          f"model output: {Image.open(io.BytesIO(enhanced)).size} PNG, {len(enhanced) / 1024:.0f} KB")
+
+    service = EnhancementService()
+    service.enhancer = StubEnhancer(enhanced)
+
+    legacy = cpu_ms(lambda: legacy_request(upload, enhanced, args.resolution), args.runs)
+    current = cpu_ms(lambda: context_request(service, upload, args.resolution), args.runs)
+
+    print(f"{'flow':<14}{'CPU ms/request':>16}")
+    print(f"{'legacy':<14}{legacy:>16.1f}")
+    print(f"{'decode-once':<14}{current:>16.1f}")
+    print(f"saved: {legacy - current:.1f} ms/request ({(1 - current / legacy) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
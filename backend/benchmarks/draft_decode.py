@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Benchmark: decoding large JPEG uploads down to the model's input size.
+
+Compares three ways of producing the model input from a phone or scanner
+JPEG:
+
+    full      decode at full resolution, then LANCZOS thumbnail (before ImageContext)
+    gap2      ImageContext before DCT scaling: thumbnail()'s own draft, which only
+              lets libjpeg scale down to twice the target
+    draft     ImageContext.scaled: libjpeg decodes at the smallest 1/2, 1/4 or 1/8
+              scale that still covers the target, LANCZOS does the rest
+
+Each measurement runs in its own subprocess with its RSS high-water mark
+(VmHWM) reset after the upload is read, so peak memory belongs to the decode
+alone. PSNR is measured against the full decode.
+
+Usage:
+    python benchmarks/draft_decode.py [--runs 3] [--resolution standard|hd]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+import subprocess
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from image_enhancement import ImageEnhancer
+from app.services.image_context import ImageContext
+
+# The app's logging config is verbose; keep the table readable
+logging.disable(logging.INFO)
+
+IMAGES = (
+    ("phone 12MP", 4032, 3024),
+    ("phone 48MP", 8064, 6048),
+    ("scan A4 600dpi", 4960, 7016),
+    ("scan 6x4 1200dpi", 7200, 4800),
+)
+
+METHODS = ("full", "gap2", "draft")
+
+
+def make_photo(width: int, height: int, seed: int = 0) -> bytes:
+    """Smooth gradients with sensor-like noise, saved as a quality 90 JPEG"""
+    small_w, small_h = width // 8, height // 8
+    y, x = np.mgrid[0:small_h, 0:small_w].astype(np.float32)
+    base = np.stack([
+        128 + 100 * np.sin(x / small_w * 3.1 + y / small_h),
+        128 + 90 * np.cos(y / small_h * 4.2),
+        128 + 80 * np.sin((x + y) / (small_w + small_h) * 6.0),
+    ], axis=-1)
+    img = Image.fromarray(base.astype(np.uint8), "RGB").resize((width, height), Image.Resampling.BICUBIC)
+    noise = np.random.default_rng(seed).integers(-8, 9, size=(height, width, 3), dtype=np.int16)
+    pixels = np.clip(np.asarray(img, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels, "RGB").save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def decode(data: bytes, method: str, target: tuple) -> Image.Image:
+    if method == "full":
+        img = Image.open(io.BytesIO(data))
+        img.load()
+        img.thumbnail(target, Image.Resampling.LANCZOS)
+        return img.convert("RGB")
+    if method == "gap2":
+        img = Image.open(io.BytesIO(data))
+        img.thumbnail(target, Image.Resampling.LANCZOS)
+        return img.convert("RGB")
+    return ImageContext.probe(data).scaled(target)
+
+
+def rss_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def run_child(path: str, method: str, target: tuple, runs: int):
+    """One method on one file, in this process; prints ms and peak RSS growth as JSON"""
+    with open(path, "rb") as f:
+        data = f.read()
+    baseline = rss_kb("VmRSS")
+    # Reset VmHWM to the current RSS (Linux 4.0+)
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        img = decode(data, method, target)
+        samples.append((time.perf_counter() - start) * 1000)
+    peak = rss_kb("VmHWM")
+    img.save(path + f".{method}.png")
+    print(json.dumps({"ms": min(samples), "peak_mb": (peak - baseline) / 1024, "size": img.size}))
+
+
+def measure(path: str, method: str, target: tuple, runs: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", method, path,
+         "--target", f"{target[0]}x{target[1]}", "--runs", str(runs)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def psnr(a_path: str, b_path: str) -> float:
+    a = np.asarray(Image.open(a_path), dtype=np.float64)
+    b = np.asarray(Image.open(b_path), dtype=np.float64)
+    if a.shape != b.shape:
+        return float("nan")
+    mse = np.mean((a - b) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--resolution", choices=["standard", "hd"], default="standard")
+    parser.add_argument("--child", nargs=2, metavar=("METHOD", "PATH"), help=argparse.SUPPRESS)
+    parser.add_argument("--target", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        width, height = (int(v) for v in args.target.split("x"))
+        run_child(args.child[1], args.child[0], (width, height), args.runs)
+        return
+
+    target = ImageEnhancer.target_size(args.resolution)
+    print(f"Target: {target[0]}x{target[1]} ({args.resolution}), best of {args.runs} runs")
+    print(f"{'image':<18}{'MB':>6}  {'method':<7}{'ms':>9}{'peak MB':>10}{'PSNR dB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, width, height in IMAGES:
+            path = os.path.join(tmp, f"{width}x{height}.jpg")
+            with open(path, "wb") as f:
+                f.write(make_photo(width, height))
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            results = {method: measure(path, method, target, args.runs) for method in METHODS}
+            for method in METHODS:
+                quality = psnr(path + ".full.png", path + f".{method}.png") if method != "full" else float("inf")
+                label = name if method == METHODS[0] else ""
+                mb = f"{size_mb:>6.1f}" if method == METHODS[0] else " " * 6
+                print(f"{label:<18}{mb}  {method:<7}{results[method]['ms']:>9.1f}"
+                      f"{results[method]['peak_mb']:>10.1f}{quality:>9.1f}")
+            full, draft = results["full"], results["draft"]
+            print(f"{'':<26}draft vs full: {full['ms'] / draft['ms']:.1f}x faster, "
+                  f"{full['peak_mb'] - draft['peak_mb']:.0f} MB less peak memory")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Load test: concurrent POST /api/enhance requests against a running API,
+reporting throughput, latency percentiles and status codes, followed by the
+server's /api/metrics.
+
+Run the API against a fake model so no Gemini quota is spent, either
+in-process:
+
+    ENHANCER_BACKEND=fake FAKE_MODEL_LATENCY_MS=1500 uvicorn main:app --port 8000
+
+or through the real Gemini client and fake_model_server.py:
+
+    python fake_model_server.py --port 8090 --error-rate 0.05 &
+    GEMINI_BASE_URL=http://localhost:8090 GOOGLE_API_KEY=fake uvicorn main:app --port 8000
+
+Every request is charged to --user-id, which needs at least --requests
+credits (grant them from the admin dashboard). The server's metrics are
+fetched with --metrics-token, its METRICS_TOKEN.
+
+Usage:
+    python benchmarks/enhance_load.py --user-id ID [--url http://localhost:8000] [--requests 50] [--concurrency 10] [--metrics-token TOKEN]
+"""
+
+import io
+import os
+import time
+import asyncio
+import argparse
+from collections import Counter
+
+import httpx
+import numpy as np
+from PIL import Image
+
+
+def make_photo(index: int, size: int = 1600) -> bytes:
+    """Distinct JPEG per request so the result cache does not absorb the load"""
+    width, height = size, size * 3 // 4
+    rng = np.random.default_rng(index)
+    pixels = rng.integers(0, 255, size=(height // 8, width // 8, 3), dtype=np.uint8)
+    img = Image.fromarray(pixels, "RGB").resize((width, height), Image.Resampling.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+async def run_request(client: httpx.AsyncClient, args, index: int, slots: asyncio.Semaphore):
+    async with slots:
+        start = time.perf_counter()
+        response = await client.post(
+            f"{args.url}/api/enhance",
+            data={"user_id": args.user_id, "mode": args.mode, "resolution": args.resolution},
+            files={"file": (f"load-{index}.jpg", make_photo(index), "image/jpeg")},
+        )
+        return response.status_code, time.perf_counter() - start
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--mode", default="enhance")
+    parser.add_argument("--resolution", default="standard")
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--metrics-token", default=os.getenv("METRICS_TOKEN"))
+    args = parser.parse_args()
+
+    slots = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(timeout=300) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*[run_request(client, args, i, slots) for i in range(args.requests)])
+        elapsed = time.perf_counter() - start
+        response = await client.get(f"{args.url}/api/metrics", headers={"X-Metrics-Token": args.metrics_token or ""})
+        metrics = response.json() if response.status_code == 200 else {}
+
+    latencies = [latency for status, latency in results if status == 200]
+    print(f"{args.requests} requests, concurrency {args.concurrency}: {elapsed:.1f}s, {args.requests / elapsed:.2f} req/s")
+    print(f"status codes: {dict(Counter(status for status, _ in results))}")
+    print(f"latency (200s): p50 {percentile(latencies, 0.5):.2f}s  p95 {percentile(latencies, 0.95):.2f}s  "
+          f"p99 {percentile(latencies, 0.99):.2f}s  max {max(latencies, default=0):.2f}s")
+    for name in ("upstream", "resilience", "image_pool"):
+        print(f"{name}: {metrics.get(name)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
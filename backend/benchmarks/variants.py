@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark: variant generation (full, preview, thumbnail) for one enhanced
+image, comparing the previous generate_multiple_sizes (two full copies, two
+LANCZOS thumbnails from full resolution, three sequential PNG encodes) with
+the resize cascade and per-variant encode tasks the app runs on the image
+process pool.
+
+As in the app, a model output already in a stored variant's format is kept
+as-is rather than encoded again. CPU time is the cascade and encode tasks run
+one after another; wall time is what the request waits with one pool worker
+per variant.
+
+Usage:
+    python benchmarks/variants.py [--runs 5] [--size 2048] [--format png|jpeg]
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from app.services.enhancement_service import IMAGE_VARIANTS, EnhancementService
+from app.services import image_tasks
+from app.utils.blurhash import encode as encode_blurhash
+
+
+def make_model_output(size: int, fmt: str, seed: int = 0) -> bytes:
+    """Photo-like image at the model's output size (4:3)"""
+    width, height = size, size * 3 // 4
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        128 + 100 * np.sin(x / width * 3.1 + y / height),
+        128 + 90 * np.cos(y / height * 4.2),
+        128 + 80 * np.sin((x + y) / (width + height) * 6.0),
+    ], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 6, size=base.shape), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels, "RGB").save(buf, format=fmt.upper(), **({"quality": 95} if fmt == "jpeg" else {}))
+    return buf.getvalue()
+
+
+def legacy_multiple_sizes(image_data: bytes) -> dict:
+    """generate_multiple_sizes, plus the separate decode generate_blurhash did"""
+    img = Image.open(io.BytesIO(image_data))
+    sizes = {}
+    for name, size in (("thumbnail", (200, 200)), ("preview", (1080, 1080))):
+        variant = img.copy()
+        variant.thumbnail(size, Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        variant.save(buf, format="PNG")
+        sizes[name] = buf.getvalue()
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    sizes["full"] = buf.getvalue()
+    blur = Image.open(io.BytesIO(image_data))
+    blur.thumbnail((100, 100), Image.Resampling.LANCZOS)
+    encode_blurhash(blur.convert("RGB"), x_components=4, y_components=3)
+    return sizes
+
+
+def measure(fn, runs: int) -> tuple[float, float]:
+    cpu, wall = [], []
+    for _ in range(runs):
+        start_cpu, start_wall = time.process_time(), time.perf_counter()
+        fn()
+        cpu.append((time.process_time() - start_cpu) * 1000)
+        wall.append((time.perf_counter() - start_wall) * 1000)
+    return sum(cpu) / runs, sum(wall) / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--format", choices=["png", "jpeg"], default="png")
+    args = parser.parse_args()
+
+    data = make_model_output(args.size, args.format)
+    print(f"Model output: {args.size}x{args.size * 3 // 4} {args.format.upper()}, {len(data) / 1024:.0f} KB, {os.cpu_count()} CPUs")
+
+    legacy = measure(lambda: legacy_multiple_sizes(data), args.runs)
+    stored = tuple(EnhancementService.stored_as_is(data))
+    sequential = measure(lambda: image_tasks.render_variants(data, skip=stored), args.runs)
+
+    names = tuple(variant.name for variant in IMAGE_VARIANTS if variant.name not in stored)
+    with ProcessPoolExecutor(max_workers=len(names)) as pool:
+        [f.result() for f in [pool.submit(image_tasks.warm_up) for _ in names]]
+
+        def cascade():
+            pixels, _ = pool.submit(image_tasks.scale_variants, data, names).result()
+            [f.result() for f in [pool.submit(image_tasks.encode_variant, name, pixels[name]) for name in names]]
+
+        parallel = measure(cascade, args.runs)
+
+    print(f"{'generator':<12}{'CPU ms':>10}{'wall ms':>10}")
+    print(f"{'legacy':<12}{legacy[0]:>10.1f}{legacy[1]:>10.1f}")
+    print(f"{'cascade':<12}{sequential[0]:>10.1f}{parallel[1]:>10.1f}")
+    print(f"CPU saved: {legacy[0] - sequential[0]:.1f} ms ({(1 - sequential[0] / legacy[0]) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Deterministic stand-in for the Gemini image model.
+
+FakeEnhancer plugs into EnhancementService in place of ImageEnhancer
+(ENHANCER_BACKEND=fake), and fake_model_server.py serves the same model over
+a Gemini-compatible HTTP API. Either way the pipeline can be load-tested and
+benchmarked offline: the output image depends only on the input and the
+mode, while latency and failures follow a configurable distribution.
+
+Configuration (environment):
+    FAKE_MODEL_LATENCY_MS     median latency of a call (default 1500)
+    FAKE_MODEL_LATENCY_SIGMA  log-normal spread of the latency (default 0.5, 0 = fixed)
+    FAKE_MODEL_ERROR_RATE     fraction of calls that fail (default 0)
+    FAKE_MODEL_ERROR_CODES    comma separated HTTP codes to fail with (default 503)
+    FAKE_MODEL_SEED           seed for latency and errors (default: unseeded)
+"""
+import io
+import os
+import math
+import random
+import asyncio
+import logging
+from typing import Optional, Sequence, Union
+from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+from image_enhancement import ImageEnhancer
+
+logger = logging.getLogger(__name__)
+
+ERROR_STATUSES = {
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+    504: "DEADLINE_EXCEEDED",
+}
+
+
+class FakeModelError(Exception):
+    """Simulated upstream failure carrying an HTTP code, like google.genai's APIError"""
+
+    def __init__(self, code: int):
+        self.code = code
+        self.status = ERROR_STATUSES.get(code, "UNKNOWN")
+        super().__init__(f"{code} {self.status}. Simulated upstream error")
+
+
+def transform(image: Image.Image, mode: str) -> bytes:
+    """Deterministic, mode dependent edit of the image, returned as PNG"""
+    img = ImageOps.autocontrast(image.convert("RGB"), cutoff=1)
+    if mode == "colorize":
+        img = ImageOps.colorize(ImageOps.grayscale(img), black="#2b1d0e", white="#fff4e0", mid="#a0785a")
+    elif mode == "enlighten":
+        img = ImageEnhance.Brightness(img).enhance(1.15)
+    elif mode == "de-scratch":
+        img = img.filter(ImageFilter.MedianFilter(3))
+    else:
+        img = img.filter(ImageFilter.UnsharpMask(radius=2, percent=80, threshold=2))
+
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+class FakeModel:
+    """Latency and error distribution of the simulated upstream"""
+
+    def __init__(
+        self,
+        latency_ms: float = 1500,
+        latency_sigma: float = 0.5,
+        error_rate: float = 0.0,
+        error_codes: Sequence[int] = (503,),
+        seed: Optional[int] = None
+    ):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes) or (503,)
+        self.random = random.Random(seed)
+
+    @classmethod
+    def from_env(cls) -> "FakeModel":
+        seed = os.getenv("FAKE_MODEL_SEED")
+        return cls(
+            latency_ms=float(os.getenv("FAKE_MODEL_LATENCY_MS", "1500")),
+            latency_sigma=float(os.getenv("FAKE_MODEL_LATENCY_SIGMA", "0.5")),
+            error_rate=float(os.getenv("FAKE_MODEL_ERROR_RATE", "0")),
+            error_codes=[int(code) for code in os.getenv("FAKE_MODEL_ERROR_CODES", "503").split(",") if code.strip()],
+            seed=int(seed) if seed else None
+        )
+
+    def sample_latency(self) -> float:
+        """Seconds; log-normal around the median so there is a realistic tail"""
+        if self.latency_ms <= 0:
+            return 0.0
+        if self.latency_sigma <= 0:
+            return self.latency_ms / 1000
+        return self.random.lognormvariate(math.log(self.latency_ms / 1000), self.latency_sigma)
+
+    def sample_error(self) -> Optional[int]:
+        if self.error_rate > 0 and self.random.random() < self.error_rate:
+            return self.random.choice(self.error_codes)
+        return None
+
+    async def respond(self, image: Image.Image, mode: str) -> bytes:
+        """Wait the sampled latency, then fail or return the transformed image"""
+        await asyncio.sleep(self.sample_latency())
+        code = self.sample_error()
+        if code:
+            raise FakeModelError(code)
+        return await asyncio.to_thread(transform, image, mode)
+
+
+class FakeEnhancer:
+    """In-process enhancer backend with the same interface as ImageEnhancer"""
+
+    def __init__(self, upstream=None, model: Optional[FakeModel] = None):
+        self.upstream = upstream
+        self.model = model or FakeModel.from_env()
+
+    @staticmethod
+    def target_size(resolution: str) -> tuple[int, int]:
+        return ImageEnhancer.target_size(resolution)
+
+    async def enhance(self, image_data: Union[bytes, Image.Image], resolution: str, mode: str = "enhance", filter_type: Optional[str] = None, custom_prompt: Optional[str] = None) -> bytes:
+        img = image_data if isinstance(image_data, Image.Image) else Image.open(io.BytesIO(image_data))
+        target_size = self.target_size(resolution)
+        if img.width > target_size[0] or img.height > target_size[1]:
+            img = img.copy()
+            img.thumbnail(target_size, Image.Resampling.LANCZOS)
+
+        logger.info(f"Fake enhancement - Mode: {mode}, Resolution: {resolution}, Size: {img.size}")
+
+        async def call():
+            return await self.model.respond(img, mode)
+
+        if self.upstream is not None:
+            return await self.upstream.call(call, ImageEnhancer.estimate_tokens("", img.size))
+        return await call()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Gemini's generateContent API, backed by fake_enhancer.
+
+Point the real ImageEnhancer (google-genai client included) at it to run
+the whole request path offline:
+
+    python fake_model_server.py --port 8090 --latency-ms 1500 --error-rate 0.05
+    GEMINI_BASE_URL=http://localhost:8090 GOOGLE_API_KEY=fake uvicorn main:app
+
+Latency and error flags default to the FAKE_MODEL_* environment variables
+described in fake_enhancer.py.
+"""
+import io
+import base64
+import argparse
+import logging
+from PIL import Image
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+import uvicorn
+
+from fake_enhancer import FakeModel, FakeModelError
+
+logger = logging.getLogger("fake_model_server")
+
+app = FastAPI(title="Fake Gemini model server")
+app.state.model = FakeModel.from_env()
+
+# Words that identify ImageEnhancer's prompt for each mode
+PROMPT_KEYWORDS = (
+    ("colorize", "color version"),
+    ("de-scratch", "scratches"),
+    ("enlighten", "lighting"),
+    ("recreate", "heavily damaged"),
+)
+
+
+def mode_for_prompt(prompt: str) -> str:
+    prompt = prompt.lower()
+    for mode, keyword in PROMPT_KEYWORDS:
+        if keyword in prompt:
+            return mode
+    return "enhance"
+
+
+def read_request(body: dict) -> tuple[str, bytes]:
+    """Prompt text and input image bytes of a generateContent request"""
+    prompt, image_data = "", None
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            if part.get("text"):
+                prompt += part["text"]
+            inline = part.get("inlineData") or part.get("inline_data")
+            if inline and inline.get("data"):
+                # The SDK sends unpadded urlsafe base64; accept standard base64 too
+                data = inline["data"]
+                image_data = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    if image_data is None:
+        raise HTTPException(status_code=400, detail="Request has no inline image")
+    return prompt, image_data
+
+
+def error_response(code: int, status: str, message: str) -> JSONResponse:
+    return JSONResponse(status_code=code, content={"error": {"code": code, "message": message, "status": status}})
+
+
+@app.post("/{api_version}/models/{target}")
+async def generate_content(api_version: str, target: str, request: Request):
+    model_name, _, method = target.partition(":")
+    if method != "generateContent":
+        return error_response(404, "NOT_FOUND", f"Method {method or target} is not supported")
+
+    try:
+        prompt, image_data = read_request(await request.json())
+        image = Image.open(io.BytesIO(image_data))
+        image.load()
+    except HTTPException as e:
+        return error_response(400, "INVALID_ARGUMENT", e.detail)
+    except Exception as e:
+        return error_response(400, "INVALID_ARGUMENT", f"Unable to process input image: {e}")
+
+    mode = mode_for_prompt(prompt)
+    try:
+        output = await request.app.state.model.respond(image, mode)
+    except FakeModelError as e:
+        logger.info(f"Simulated {e.code} for {model_name} ({mode})")
+        return error_response(e.code, e.status, "Simulated upstream error")
+
+    return {
+        "candidates": [{
+            "content": {
+                "role": "model",
+                "parts": [{"inlineData": {"mimeType": "image/png", "data": base64.b64encode(output).decode("ascii")}}]
+            },
+            "finishReason": "STOP",
+            "index": 0
+        }],
+        "modelVersion": model_name
+    }
+
+
+def main():
+    defaults = FakeModel.from_env()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--latency-sigma", type=float, default=defaults.latency_sigma)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--error-codes", default=",".join(str(code) for code in defaults.error_codes))
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    app.state.model = FakeModel(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        error_codes=[int(code) for code in args.error_codes.split(",") if code.strip()],
+        seed=args.seed
+    )
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 import io
+import math
+import time
 import base64
+import asyncio
 import logging
 from PIL import Image
-from typing import Optional
+from typing import Optional, Union
 import os
 from google import genai
 from google.genai import types
@@ -11,39 +14,116 @@ from google.genai import types
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+WIRE_MIME_TYPES = {
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "png": "image/png",
+}
+
+
+def _parse_wire_formats(default: str, overrides: str) -> dict[str, tuple[str, int]]:
+    """
+    Parse GEMINI_WIRE_FORMAT ("jpeg:90") and GEMINI_WIRE_FORMAT_OVERRIDES
+    ("de-scratch:png,recreate:webp:92") into {mode: (format, quality)}.
+    The "*" entry is the default for modes without an override.
+    """
+    def parse(spec: str, fallback: tuple[str, int]) -> tuple[str, int]:
+        parts = [p.strip().lower() for p in spec.split(":") if p.strip()]
+        fmt = parts[0] if parts else fallback[0]
+        if fmt == "jpg":
+            fmt = "jpeg"
+        if fmt not in WIRE_MIME_TYPES:
+            logger.warning(f"Unknown wire format '{fmt}', using {fallback[0]}")
+            fmt = fallback[0]
+        quality = int(parts[1]) if len(parts) > 1 else fallback[1]
+        return fmt, quality
+
+    formats = {"*": parse(default, ("jpeg", 90))}
+    for entry in overrides.split(","):
+        if ":" not in entry:
+            continue
+        mode, spec = entry.split(":", 1)
+        formats[mode.strip()] = parse(spec, formats["*"])
+    return formats
+
+
+class UpstreamRejected(Exception):
+    """A Gemini call was refused locally (quota, queue or breaker) without reaching the API"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
 
 class ImageEnhancer:
     """Image enhancement using Gemini's nano-banana model"""
-    
-    def __init__(self):
+
+    # Upper bound on concurrent Gemini calls per worker process when no
+    # upstream admission control is injected (GEMINI_MAX_CONCURRENCY).
+    # Shared across instances so that per-request enhancers still respect
+    # the same limit.
+    _call_slots: Optional[asyncio.Semaphore] = None
+    _call_slot_count = 0
+
+    # Encoding used for the image sent to Gemini, per mode
+    wire_formats = _parse_wire_formats(
+        os.getenv("GEMINI_WIRE_FORMAT", "jpeg:90"),
+        os.getenv("GEMINI_WIRE_FORMAT_OVERRIDES", "")
+    )
+
+    def __init__(self, upstream=None):
+        # Optional upstream policy (admission control, retries): an object
+        # whose async call(fn, tokens) runs fn, a coroutine function making
+        # one Gemini request, and returns its result
+        self.upstream = upstream
         self.client = None
         api_key = os.getenv("GOOGLE_API_KEY")
         if api_key:
-            self.client = genai.Client(api_key=api_key)
+            # GEMINI_BASE_URL points the client at another endpoint, e.g. fake_model_server.py
+            base_url = os.getenv("GEMINI_BASE_URL")
+            http_options = types.HttpOptions(base_url=base_url) if base_url else None
+            self.client = genai.Client(api_key=api_key, http_options=http_options)
             self.model = "gemini-2.5-flash-image-preview"
     
-    async def enhance(self, image_data: bytes, resolution: str, mode: str = "enhance", filter_type: Optional[str] = None, custom_prompt: Optional[str] = None) -> bytes:
+    @staticmethod
+    def target_size(resolution: str) -> tuple[int, int]:
+        """Largest size sent to the model for a resolution"""
+        return (2048, 2048) if resolution == "hd" else (1024, 1024)
+
+    async def enhance(self, image_data: Union[bytes, Image.Image], resolution: str, mode: str = "enhance", filter_type: Optional[str] = None, custom_prompt: Optional[str] = None) -> bytes:
         """
         Enhance image using Gemini's image generation model
+
+        image_data is either encoded image bytes or an already decoded RGB
+        image that fits within target_size(resolution).
         """
         try:
             logger.info(f"Starting image enhancement - Mode: {mode}, Resolution: {resolution}, Filter: {filter_type}")
-            logger.debug(f"Input image size: {len(image_data)} bytes")
 
             if not self.client:
                 raise Exception("Gemini client not initialized")
 
-            # Open and prepare image
-            img = Image.open(io.BytesIO(image_data))
-            logger.info(f"Original image format: {img.format}, mode: {img.mode}, size: {img.size}")
-
             # Determine target size
-            target_size = (2048, 2048) if resolution == "hd" else (1024, 1024)
+            target_size = self.target_size(resolution)
             logger.debug(f"Target size: {target_size}")
 
-            # Resize while maintaining aspect ratio
-            img.thumbnail(target_size, Image.Resampling.LANCZOS)
-            logger.debug(f"Resized image size: {img.size}")
+            if isinstance(image_data, Image.Image):
+                # Caller already decoded and downscaled the image
+                img = image_data
+                logger.info(f"Using prepared image - mode: {img.mode}, size: {img.size}")
+            else:
+                logger.debug(f"Input image size: {len(image_data)} bytes")
+
+                # Open and prepare image
+                img = Image.open(io.BytesIO(image_data))
+                logger.info(f"Original image format: {img.format}, mode: {img.mode}, size: {img.size}")
+
+            # Resize while maintaining aspect ratio (no-op for prepared images)
+            if img.width > target_size[0] or img.height > target_size[1]:
+                # On a copy: a prepared image may be a view the caller keeps using
+                img = img.copy()
+                img.thumbnail(target_size, Image.Resampling.LANCZOS)
+                logger.debug(f"Resized image size: {img.size}")
 
             # Convert to RGB if needed
             if img.mode != 'RGB':
@@ -60,13 +140,11 @@ class ImageEnhancer:
 
             logger.debug(f"Using prompt: {prompt[:100]}...")
 
+            # Encode the image ourselves so the wire format is explicit
+            image_part = self._encode_for_model(img, mode)
+
             # Generate enhanced image using the correct API pattern
-            logger.info("Calling Gemini API...")
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=[prompt, img],
-            )
-            logger.info("Gemini API call completed")
+            response = await self._generate_content([prompt, image_part], self.estimate_tokens(prompt, img.size))
 
             # Extract the enhanced image from response
             enhanced_data = None
@@ -116,11 +194,80 @@ class ImageEnhancer:
             logger.info("Image enhancement completed successfully")
             return enhanced_data
 
+        except UpstreamRejected:
+            raise
         except Exception as e:
             logger.error(f"Gemini enhancement failed: {str(e)}", exc_info=True)
             # Re-raise the exception to be handled by the API endpoint
             raise Exception(f"Gemini enhancement failed: {str(e)}")
     
+    def _encode_for_model(self, img: Image.Image, mode: str) -> types.Part:
+        """Encode the prepared image in the wire format configured for the mode"""
+        fmt, quality = self.wire_formats.get(mode, self.wire_formats["*"])
+
+        start = time.perf_counter()
+        buffer = io.BytesIO()
+        if fmt == "png":
+            img.save(buffer, format="PNG")
+        elif fmt == "webp":
+            img.save(buffer, format="WEBP", quality=quality, method=4)
+        else:
+            img.save(buffer, format="JPEG", quality=quality, subsampling=0 if quality >= 90 else 2, optimize=False)
+        data = buffer.getvalue()
+        encode_ms = (time.perf_counter() - start) * 1000
+
+        logger.info(f"Encoded model input - mode: {mode}, format: {fmt}, quality: {quality if fmt != 'png' else 'lossless'}, "
+                    f"size: {img.size}, bytes: {len(data)}, encode time: {encode_ms:.1f}ms")
+        return types.Part.from_bytes(data=data, mime_type=WIRE_MIME_TYPES[fmt])
+
+    @classmethod
+    def _get_call_slots(cls) -> asyncio.Semaphore:
+        """Semaphore bounding in-flight Gemini calls, created on first use"""
+        if cls._call_slots is None:
+            # Imported here as the app package imports this module while loading
+            from app.config.settings import settings
+            cls._call_slot_count = max(1, settings.GEMINI_MAX_CONCURRENCY)
+            cls._call_slots = asyncio.Semaphore(cls._call_slot_count)
+        return cls._call_slots
+
+    @staticmethod
+    def estimate_tokens(prompt: str, size: tuple[int, int]) -> int:
+        """
+        Rough token cost of one call: the prompt text, the input image (258
+        tokens per 768px tile, one tile for images up to 384px) and the
+        generated image
+        """
+        width, height = size
+        if width <= 384 and height <= 384:
+            image_tokens = 258
+        else:
+            image_tokens = 258 * math.ceil(width / 768) * math.ceil(height / 768)
+        return len(prompt) // 4 + image_tokens + 1290
+
+    async def _generate_content(self, contents: list, tokens: int = 0):
+        """
+        Call Gemini through the SDK's async client so the event loop keeps
+        serving other requests while the model is working
+        """
+        async def call():
+            logger.info("Calling Gemini API...")
+            response = await self.client.aio.models.generate_content(
+                model=self.model,
+                contents=contents,
+            )
+            logger.info("Gemini API call completed")
+            return response
+
+        if self.upstream is not None:
+            return await self.upstream.call(call, tokens)
+
+        slots = self._get_call_slots()
+        if slots.locked():
+            logger.info(f"All {self._call_slot_count} Gemini call slots busy, waiting...")
+
+        async with slots:
+            return await call()
+
     def _get_prompt_for_mode(self, mode: str) -> str:
         """Get the appropriate prompt based on the enhancement mode"""
         
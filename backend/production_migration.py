@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """
-Production migration script to add new columns for multi-size images and blurhash
+Production migration script to add new columns for multi-size images, blurhash
+and the processing tier
 Run this in the production backend container:
 python production_migration.py
 """
@@ -41,6 +42,11 @@ def run_migration():
             conn.execute(text('ALTER TABLE enhancements ADD COLUMN blurhash VARCHAR'))
             changes_made.append("blurhash")
 
+        if 'processing_tier' not in columns:
+            print("Adding processing_tier column...")
+            conn.execute(text("ALTER TABLE enhancements ADD COLUMN processing_tier VARCHAR DEFAULT 'model'"))
+            changes_made.append("processing_tier")
+
         conn.commit()
 
         if changes_made:
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Importing the app package connects to DATABASE_URL; tests never need a real database
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))